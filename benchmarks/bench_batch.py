@@ -0,0 +1,219 @@
+"""
+Throughput benchmark for the transcode batch (core.scheduler and the batch pipeline).
+
+Builds a synthetic library of sparse files, points 'HandBrake CLI' at
+benchmarks/fake_handbrake.py and runs the batch at several worker counts. Two
+modes are timed: "scheduler" queues every file on a TranscodeScheduler up
+front, "pipeline" runs the rename -> probe -> transcode -> verify -> cleanup
+BatchPipeline that MainWindow.start_batch uses, journal included (without the
+Tk window). For every
+run it reports the makespan, the efficiency against the simulated encode time,
+the scheduler callback rate the UI has to absorb and the mean per-job
+overhead (wall time of a job minus its simulated encode time).
+
+Usage (from the repository root):
+    python benchmarks/bench_batch.py                          # 24 files, 1/2/4 workers, both modes
+    python benchmarks/bench_batch.py --workers 1 8 --files 100 --speed 2000
+    python benchmarks/bench_batch.py --fail-rate 0.1 --stall-rate 0.05
+    python benchmarks/bench_batch.py --compare old.json       # print makespan ratios against an earlier run
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+from datetime import datetime
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent / "metamorph"))
+
+from core.config import Config
+from core.scheduler import TranscodeScheduler
+from core.batch_pipeline import BatchPipeline
+from core.batch_journal import BatchJournal
+from core.rename_plan import RenamePlan
+
+BYTE_RATE = 500_000    # source bytes per media second, as in fake_handbrake.py
+
+# ----- Fixture -----
+def make_launcher(folder: Path) -> str:
+    """ An executable that runs fake_handbrake.py with this Python, usable as 'HandBrake CLI' """
+    script = HERE / "fake_handbrake.py"
+    if sys.platform == "win32":
+        launcher = folder / "HandBrakeCLI.cmd"
+        launcher.write_text(f'@"{sys.executable}" "{script}" %*\r\n', encoding="utf-8")
+    else:
+        launcher = folder / "HandBrakeCLI"
+        launcher.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{script}" "$@"\n', encoding="utf-8")
+        launcher.chmod(0o755)
+    return str(launcher)
+
+def make_library(folder: Path, count: int, minutes: float, seed: int = 42):
+    """ count sparse episodes of minutes +-50% media time; returns [(path, media seconds)] """
+    rnd = random.Random(seed)
+    folder.mkdir(parents=True, exist_ok=True)
+    files = []
+    for i in range(count):
+        seconds = minutes * 60 * rnd.uniform(0.5, 1.5)
+        path = folder / f"Benchmark Show (2020) S01E{i + 1:02}.mkv"
+        with open(path, "wb") as file:
+            file.truncate(int(seconds * BYTE_RATE))
+        files.append((path, seconds))
+    return files
+
+def configure(launcher: str, args):
+    Config.set('HandBrake CLI', launcher)
+    Config.set('HB JSON Progress', not args.text)
+    Config.set('Worker Priority', "Normal")
+    Config.set('Stall Timeout', args.stall_timeout)
+    # Pipeline settings pinned to their defaults, whatever the local config says
+    for key, value in {'Longest Jobs First': True, 'Verify Outputs': True, 'Adaptive Workers': False,
+                       'Pin Worker CPUs': False, 'Scratch Directory': "", 'Encode Timeout': 0, 'Probe Workers': 4,
+                       'Verify Workers': 2, 'Cleanup Workers': 1, 'Stage Queue Size': 64}.items():
+        Config.set(key, value)
+    os.environ["FAKE_HB_SPEED"] = str(args.speed)
+    os.environ["FAKE_HB_BYTE_RATE"] = str(BYTE_RATE)
+    os.environ["FAKE_HB_FAIL_RATE"] = str(args.fail_rate)
+    os.environ["FAKE_HB_STALL_RATE"] = str(args.stall_rate)
+
+# ----- Runs -----
+class Counters:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.callbacks = 0
+        self.finished = threading.Event()
+
+    def hit(self, *_args, **_kwargs):
+        with self.lock:
+            self.callbacks += 1
+
+def finisher(counters: Counters):
+    def finished(cancelled):
+        counters.hit()
+        counters.finished.set()
+    return finished
+
+def run_scheduler(files, output_dir: Path, workers: int, args):
+    """ Every file queued before start, as a batch resumed from the journal """
+    counters = Counters()
+    scheduler = TranscodeScheduler(max_workers=workers, on_start=counters.hit, on_progress=counters.hit,
+                                   on_done=counters.hit, on_finished=finisher(counters), longest_first=True,
+                                   stall_timeout=args.stall_timeout or None)
+    started = time.monotonic()
+    for idx, (path, seconds) in enumerate(files):
+        scheduler.submit(idx, str(path), str(output_dir), media=None)
+    scheduler.start()
+    counters.finished.wait()
+    return time.monotonic() - started, scheduler, counters
+
+def run_pipeline(files, output_dir: Path, workers: int, args):
+    """ The BatchPipeline of start_batch, fed by its RenamePlan and deleting the originals """
+    counters = Counters()
+    pairs = [(path, path.with_name("renamed " + path.name)) for path, _ in files]
+    batch = BatchJournal(str(output_dir.parent / "batch.jsonl"))
+    batch.begin(pairs, output_dir=str(output_dir), del_original=True)
+
+    Config.set('Max Workers', workers)
+    pipeline = BatchPipeline(batch, len(pairs), on_start=counters.hit, on_progress=counters.hit,
+                             on_done=counters.hit, on_rejected=counters.hit, on_finished=finisher(counters))
+    started = time.monotonic()
+    pipeline.start()
+    pipeline.rename(RenamePlan(pairs), pairs)
+    counters.finished.wait()
+    return time.monotonic() - started, pipeline.scheduler, counters
+
+MODES = {"scheduler": run_scheduler, "pipeline": run_pipeline}
+
+def summarize(makespan: float, scheduler: TranscodeScheduler, counters: Counters, files, workers: int, args):
+    encode = {idx: seconds / args.speed for idx, (_, seconds) in enumerate(files)}
+    jobs = list(scheduler.jobs.values())
+    done = [job for job in jobs if job.state == "done"]
+    overheads = [job.finished - job.started - encode[job.job_id] for job in done]
+    ideal = sum(encode[job.job_id] for job in done) / workers
+    return {
+        "files": len(files),
+        "done": len(done),
+        "failed": sum(job.state == "failed" for job in jobs),
+        "makespan_seconds": round(makespan, 3),
+        "efficiency": round(ideal / makespan, 3) if makespan else None,
+        "callbacks": counters.callbacks,
+        "callbacks_per_second": round(counters.callbacks / makespan, 1) if makespan else None,
+        "overhead_per_job_seconds": round(sum(overheads) / len(overheads), 4) if overheads else None,
+    }
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=HERE, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results: dict, baseline_path: str):
+    with open(baseline_path, 'r', encoding='utf-8') as file:
+        baseline = json.load(file)
+    print(f"\nCompared with {baseline_path} ({baseline.get('revision')}):")
+    for key, current in results["results"].items():
+        old = baseline.get("results", {}).get(key)
+        if old and old.get("makespan_seconds") and current.get("makespan_seconds"):
+            ratio = old["makespan_seconds"] / current["makespan_seconds"]
+            flag = "  <-- slower" if ratio < 0.9 else ""
+            print(f"  {key:<24} x{ratio:5.2f}{flag}")
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark MetaMorph batch transcoding against a simulated HandBrakeCLI.")
+    parser.add_argument("--files", type=int, default=24, help="episodes in the synthetic library")
+    parser.add_argument("--minutes", type=float, default=22, help="mean media length per episode")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="worker counts to run")
+    parser.add_argument("--modes", nargs="+", choices=sorted(MODES), default=sorted(MODES))
+    parser.add_argument("--speed", type=float, default=600, help="simulated media seconds encoded per second")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of files that fail halfway")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="share of files that hang halfway")
+    parser.add_argument("--stall-timeout", type=float, default=5.0, help="'Stall Timeout' for the runs")
+    parser.add_argument("--text", action="store_true", help="text progress instead of --json")
+    parser.add_argument("--output", default="bench_batch.json", help="machine-readable results file")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args(argv)
+    logging.disable(logging.INFO)
+
+    results = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "results": {},
+    }
+    root = Path(tempfile.mkdtemp(prefix="metamorph-bench-"))
+    try:
+        configure(make_launcher(root), args)
+        for mode in args.modes:
+            for workers in args.workers:
+                run_dir = root / f"{mode}-{workers}"
+                files = make_library(run_dir / "library", args.files, args.minutes)
+                makespan, scheduler, counters = MODES[mode](files, run_dir / "output", workers, args)
+                r = results["results"][f"{mode}/{workers}"] = summarize(makespan, scheduler, counters, files, workers, args)
+                print(f"{mode:<10} {workers:>3} workers  {r['makespan_seconds']:8.2f}s  efficiency {r['efficiency']:.2f}  "
+                      f"{r['callbacks_per_second']:7.1f} callbacks/s  overhead {r['overhead_per_job_seconds'] or 0:.3f}s/job  "
+                      f"{r['done']}/{r['files']} done")
+                shutil.rmtree(run_dir, ignore_errors=True)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(results, file, indent=2)
+    print(f"\nResults written to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
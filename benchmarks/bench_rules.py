@@ -0,0 +1,186 @@
+"""
+Benchmarks for the rename rules engine (core.rules).
+
+Generates synthetic filename corpora with TV-style "S01E02" names plus CSV and
+TV metadata maps, times the rule primitives and full rule chains, and writes
+files/second and peak memory per benchmark to a JSON file.
+
+Usage (from the repository root):
+    python benchmarks/bench_rules.py                       # 10k and 100k names
+    python benchmarks/bench_rules.py --sizes 10000 100000 1000000
+    python benchmarks/bench_rules.py --compare old.json    # print speed ratios against an earlier run
+"""
+import os
+import sys
+import gc
+import json
+import time
+import random
+import argparse
+import platform
+import tracemalloc
+import subprocess
+from pathlib import Path
+from datetime import datetime
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "metamorph"))
+
+from core.rules import RenameRule, CompiledRuleSet, apply_rule_to_path, apply_tags, apply_rules_batch, sanitize_filename
+
+SHOWS = ["The Expanse", "Doctor Who", "Star Trek: Voyager", "Twin Peaks", "Better Call Saul", "Dark", "Fargo", "Chernobyl"]
+WORDS = ["pilot", "finale", "part", "return", "the", "night", "of", "a", "new", "hope", "storm", "edge", "<final>", "cut?"]
+EXTS = ["mkv", "mp4", "avi", "m4v"]
+
+# ----- Corpora -----
+def make_corpus(size: int, seed: int = 42):
+    """ Return (paths, csv_metadata, tv_metadata) for size synthetic files """
+    rnd = random.Random(seed)
+    paths, csv_metadata, tv_metadata = [], {}, {}
+    for i in range(size):
+        show = rnd.choice(SHOWS)
+        year = rnd.randint(1960, 2024)
+        season, episode = rnd.randint(1, 12), rnd.randint(1, 30)
+        title = " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(1, 4)))
+        style = i % 3
+        if style == 0:
+            name = f"{show} ({year}) S{season:02}E{episode:02} - {title}.{rnd.choice(EXTS)}"
+        elif style == 1:
+            name = f"{show.lower().replace(' ', '.')}.s{season:02}e{episode:02}.{i}.720p.{rnd.choice(EXTS)}"
+        else:
+            name = f"VID_{i:07}_{title}.{rnd.choice(EXTS)}"
+        paths.append(Path(f"/library/{show}/{name}"))
+        tv_metadata[name] = {"show": show, "season": season, "year": year, "episode": episode, "title": title}
+        csv_metadata[name] = {"Title": title, "Csv:1": show, "Csv:2": str(season), "Csv:Title": title}
+    return paths, csv_metadata, tv_metadata
+
+def merged_metadata(csv_metadata, tv_metadata):
+    merged = {}
+    for name, tv in tv_metadata.items():
+        merged[name] = dict(tv)
+        merged[name].update(csv_metadata.get(name, {}))
+    return merged
+
+# ----- Rules -----
+SINGLE_RULES = {
+    "replace": RenameRule("Replace", {"old": ".", "new": " ", "case_sensitive": True}),
+    "replace_icase": RenameRule("Replace", {"old": "S0", "new": "s0", "case_sensitive": False}),
+    "regex_replace": RenameRule("Regex_Replace", {"pattern": r"[Ss](\d+)[Ee](\d+)", "repl": r"S\1E\2"}),
+    "change_case": RenameRule("Change_Case", {"mode": "title"}),
+    "numbering": RenameRule("Numbering", {"template": "{name}_{num:4}", "start": 1, "increment": 1}),
+    "new_name": RenameRule("New_Name", {"template": "{show} ({year}) S{season:2}E{episode:2} - {title}.{ext}"}),
+}
+CHAINS = {
+    "tv_chain": [
+        RenameRule("Regex_Replace", {"pattern": r"\.(\d{3,4}p)", "repl": ""}),
+        RenameRule("Replace", {"old": ".", "new": " "}),
+        RenameRule("Change_Case", {"mode": "title"}),
+        RenameRule("New_Name", {"template": "{show} ({year}) S{season:2}E{episode:2} - {Csv:Title}.{ext}"}),
+    ],
+    "numbering_chain": [
+        RenameRule("Trim", {"side": "right", "count": 2}),
+        RenameRule("Prefix_Suffix", {"prefix": "{num:5}_", "suffix": "", "use_tags": True}),
+        RenameRule("Numbering", {"template": "{name}-{num:5}", "start": 1, "increment": 1}),
+        RenameRule("Change_Ext", {"ext": "mkv"}),
+    ],
+}
+TEMPLATES = {
+    "tags_plain": "{name}_{num:3}",
+    "tags_tv": "{show} S{season:2}E{episode:2}",
+    "tags_csv": "{Csv:1} - {Csv:Title} [{Csv:9}]",
+}
+
+# ----- Harness -----
+def measure(func, count: int, track_memory: bool):
+    """ Run func once for timing and, optionally, once more under tracemalloc for peak memory """
+    gc.collect()
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    peak = None
+    if track_memory:
+        gc.collect()
+        tracemalloc.start()
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return {
+        "files": count,
+        "seconds": round(elapsed, 6),
+        "files_per_second": round(count / elapsed, 1) if elapsed else None,
+        "peak_memory_bytes": peak,
+    }
+
+def benchmarks_for(size: int):
+    """ Yield (name, callable) pairs for one corpus size """
+    paths, csv_metadata, tv_metadata = make_corpus(size)
+    metadata = merged_metadata(csv_metadata, tv_metadata)
+    meta_list = [metadata[p.name] for p in paths]
+    names = [p.name for p in paths]
+
+    yield "sanitize_filename", lambda: [sanitize_filename(n) for n in names]
+    for key, template in TEMPLATES.items():
+        yield f"apply_tags[{key}]", lambda t=template: [apply_tags(t, p, i, md) for i, (p, md) in enumerate(zip(paths, meta_list))]
+    for key, rule in SINGLE_RULES.items():
+        yield f"apply_rule_to_path[{key}]", lambda r=rule: [apply_rule_to_path(r, p, i, md) for i, (p, md) in enumerate(zip(paths, meta_list))]
+    for key, rules in CHAINS.items():
+        def run_chain(rules=rules):
+            ruleset = CompiledRuleSet(rules)
+            return [ruleset.run(p, i, md) for i, (p, md) in enumerate(zip(paths, meta_list))]
+        yield f"chain[{key}]", run_chain
+        yield f"apply_rules_batch[{key}]", lambda r=rules: apply_rules_batch(paths, r, metadata, parallel_threshold=None)
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).resolve().parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results: dict, baseline_path: str):
+    with open(baseline_path, 'r', encoding='utf-8') as file:
+        baseline = json.load(file)
+    print(f"\nCompared with {baseline_path} ({baseline.get('revision')}):")
+    for size, benches in results["results"].items():
+        for name, current in benches.items():
+            old = baseline.get("results", {}).get(size, {}).get(name)
+            if old and old.get("files_per_second") and current.get("files_per_second"):
+                ratio = current["files_per_second"] / old["files_per_second"]
+                flag = "  <-- slower" if ratio < 0.9 else ""
+                print(f"  {size:>8} {name:<40} x{ratio:5.2f}{flag}")
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the MetaMorph rename rules engine.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000], help="corpus sizes (e.g. 10000 100000 1000000)")
+    parser.add_argument("--output", default="bench_rules.json", help="machine-readable results file")
+    parser.add_argument("--filter", default="", help="only run benchmarks whose name contains this text")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass (halves run time)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args(argv)
+
+    results = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "results": {},
+    }
+    for size in args.sizes:
+        per_size = results["results"][str(size)] = {}
+        for name, func in benchmarks_for(size):
+            if args.filter not in name:
+                continue
+            per_size[name] = measure(func, size, not args.no_memory)
+            r = per_size[name]
+            memory = f"{r['peak_memory_bytes'] / 1e6:8.1f} MB" if r["peak_memory_bytes"] is not None else ""
+            print(f"{size:>8} {name:<40} {r['files_per_second']:>12,.0f} files/s {memory}")
+
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(results, file, indent=2)
+    print(f"\nResults written to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+"""
+Stand-in for HandBrakeCLI, for benchmarks and scheduling tests without real encodes.
+
+Point the 'HandBrake CLI' setting at this script (or at a wrapper that runs it
+with Python). It accepts the arguments MetaMorph passes (-i, -o, -Z,
+--preset-import-file, --json, --scan) and prints progress the way HandBrakeCLI
+does: "Progress: {...}" JSON blocks with --json, carriage-return "Encoding:"
+lines without it, and log lines on stderr. --scan prints a "JSON Title Set".
+
+Sources are simulated rather than decoded: a file's duration is its size
+divided by FAKE_HB_BYTE_RATE, so sparse files of the right size stand in for
+a library. Behaviour is set through environment variables:
+    FAKE_HB_SPEED        media seconds encoded per wall second (default 600)
+    FAKE_HB_BYTE_RATE    source bytes per media second (default 500000, ~4 Mbit/s)
+    FAKE_HB_PASSES       passes per encode (default 1)
+    FAKE_HB_UPDATE_HZ    progress reports per second (default 20)
+    FAKE_HB_FAIL_RATE    share of inputs that fail halfway with exit code 3 (default 0)
+    FAKE_HB_STALL_RATE   share of inputs that hang silently halfway (default 0)
+    FAKE_HB_SEED         salt for picking which inputs fail or stall (default "")
+Which inputs fail or stall depends only on their name and the seed, so runs
+are repeatable.
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+
+FPS = 23.976
+
+def env(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+def arg(argv, flag: str, default=None):
+    return argv[argv.index(flag) + 1] if flag in argv and argv.index(flag) + 1 < len(argv) else default
+
+def fate(path: str) -> str:
+    """ "fail", "stall" or "ok" for an input, stable across runs """
+    digest = hashlib.sha1((os.environ.get("FAKE_HB_SEED", "") + os.path.basename(path)).encode("utf-8")).digest()
+    roll = int.from_bytes(digest[:4], "big") / 2 ** 32
+    fail, stall = env("FAKE_HB_FAIL_RATE", 0), env("FAKE_HB_STALL_RATE", 0)
+    return "fail" if roll < fail else "stall" if roll < fail + stall else "ok"
+
+def duration_of(path: str) -> float:
+    return max(1.0, os.path.getsize(path) / max(1.0, env("FAKE_HB_BYTE_RATE", 500_000)))
+
+def log(message: str):
+    sys.stderr.write(f"[{time.strftime('%H:%M:%S')}] {message}\n")
+    sys.stderr.flush()
+
+def block(label: str, data: dict):
+    print(f"{label}: " + json.dumps(data, indent=4), flush=True)
+
+def scan(path: str) -> int:
+    duration = duration_of(path)
+    ticks = int(duration * 90000)
+    hours, rest = divmod(int(duration), 3600)
+    block("Progress", {"State": "SCANNING", "Scanning": {"Preview": 1, "PreviewCount": 10, "Progress": 0.5,
+                                                         "SequenceID": 0, "Title": 1, "TitleCount": 1}})
+    block("JSON Title Set", {"MainFeature": 0, "TitleList": [{
+        "Name": os.path.splitext(os.path.basename(path))[0], "Path": path, "Index": 1,
+        "Duration": {"Hours": hours, "Minutes": rest // 60, "Seconds": rest % 60, "Ticks": ticks},
+        "Geometry": {"Width": 1920, "Height": 1080, "PAR": {"Num": 1, "Den": 1}},
+        "FrameRate": {"Num": 24000, "Den": 1001}, "VideoCodec": "h264",
+        "AudioList": [{"TrackNumber": 1, "CodecName": "aac", "Language": "English"}],
+        "SubtitleList": []}]})
+    return 0
+
+def report(json_mode: bool, pass_index: int, passes: int, progress: float, rate: float, eta: float):
+    if json_mode:
+        block("Progress", {"State": "WORKING", "Working": {
+            "ETASeconds": int(eta), "Hours": int(eta) // 3600, "Minutes": int(eta) // 60 % 60, "Seconds": int(eta) % 60,
+            "Pass": pass_index, "PassCount": passes, "PassID": pass_index if passes > 1 else -1,
+            "Paused": 0, "Progress": round(progress, 4), "Rate": round(rate, 2), "RateAvg": round(rate, 2),
+            "SequenceID": 1}})
+    else:
+        eta = int(eta)
+        sys.stdout.write(f"\rEncoding: task {pass_index} of {passes}, {progress * 100:.2f} % ({rate:.2f} fps, "
+                         f"avg {rate:.2f} fps, ETA {eta // 3600:02}h{eta // 60 % 60:02}m{eta % 60:02}s)")
+        sys.stdout.flush()
+
+def encode(source: str, output: str, json_mode: bool) -> int:
+    duration = duration_of(source)
+    speed = max(0.001, env("FAKE_HB_SPEED", 600))
+    passes = max(1, int(env("FAKE_HB_PASSES", 1)))
+    interval = 1.0 / max(0.1, env("FAKE_HB_UPDATE_HZ", 20))
+    outcome = fate(source)
+    pass_seconds = duration / speed
+    rate = FPS * speed
+
+    if json_mode:
+        block("Version", {"Arch": "x86_64", "Name": "HandBrake", "Official": False, "System": sys.platform,
+                          "Type": "simulated", "Version": {"Major": 1, "Minor": 0, "Point": 0}, "VersionString": "fake"})
+    log(f"fake HandBrake: {source} -> {output}, {duration:.0f}s of media at {speed:g}x, {passes} pass(es)")
+    started = time.monotonic()
+    total = pass_seconds * passes
+    while True:
+        elapsed = time.monotonic() - started
+        done = min(1.0, elapsed / total) if total else 1.0
+        if outcome != "ok" and done >= 0.5:
+            if outcome == "fail":
+                log("Encode failed (simulated)")
+                return 3
+            log("simulated stall")
+            while True:
+                time.sleep(3600)
+        if done >= 1.0:
+            break
+        pass_index = min(passes, int(elapsed // pass_seconds) + 1) if pass_seconds else passes
+        pass_progress = (elapsed - (pass_index - 1) * pass_seconds) / pass_seconds if pass_seconds else 1.0
+        report(json_mode, pass_index, passes, min(1.0, pass_progress), rate, total - elapsed)
+        time.sleep(interval)
+
+    if json_mode:
+        block("Progress", {"State": "MUXING", "Muxing": {"Progress": 0.0}})
+    # A sparse output the size of the source: a --scan of it then reports the source's duration
+    with open(output, "wb") as file:
+        file.truncate(os.path.getsize(source))
+    if json_mode:
+        block("Progress", {"State": "WORKDONE", "WorkDone": {"Error": 0, "SequenceID": 1}})
+    else:
+        sys.stdout.write("\n")
+    log("Encode done!")
+    return 0
+
+def main(argv=None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    source = arg(argv, "-i") or arg(argv, "--input")
+    if not source or not os.path.exists(source):
+        log(f"No title found: {source}")
+        return 2
+    if "--scan" in argv:
+        return scan(source)
+    output = arg(argv, "-o") or arg(argv, "--output")
+    if not output:
+        log("Missing output file name")
+        return 1
+    return encode(source, output, "--json" in argv)
+
+if __name__ == "__main__":
+    sys.exit(main())
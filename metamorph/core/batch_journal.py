@@ -0,0 +1,84 @@
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from core.journal import Journal
+
+# ----- Job states -----
+QUEUED = "queued"
+RENAMED = "renamed"
+ENCODING = "encoding"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+class BatchJournal:
+    """
+    Per-file state of a batch (queued -> renamed -> encoding -> done/failed/cancelled),
+    persisted in a Journal so a batch interrupted by a crash or reboot can be
+    resumed at the files that had not finished. Completed files are known
+    from the journal alone; their outputs are not checked again.
+    """
+    def __init__(self, path: str):
+        self.journal = Journal(path)
+        self.files: List[Tuple[str, str]] = []
+        self.states: List[str] = []
+        self.outputs: Dict[int, str] = {}
+        self.options: dict = {}
+        self.complete = False
+
+    def begin(self, pairs: Iterable[Tuple[Path, Path]], **options):
+        """ Start a new batch of (source, target) files, all queued """
+        self.journal.remove()
+        self.files = [(str(src), str(dst)) for src, dst in pairs]
+        self.states = [QUEUED] * len(self.files)
+        self.outputs = {}
+        self.options = options
+        self.complete = False
+        self.journal.append({'event': 'batch', 'files': self.files, 'options': options})
+
+    def mark(self, indices: Iterable[int], state: str, output: Optional[str] = None):
+        """ Record a state transition for one or more files (one fsync for all) """
+        records = []
+        for index in indices:
+            self.states[index] = state
+            record = {'event': 'state', 'index': index, 'state': state}
+            if output:
+                self.outputs[index] = output
+                record['output'] = output
+            records.append(record)
+        self.journal.append_many(records)
+
+    def finish(self):
+        self.complete = True
+        self.journal.append({'event': 'complete'})
+
+    def remove(self):
+        self.journal.remove()
+
+    # ---------------
+    # Recovery
+    # ---------------
+    @classmethod
+    def load(cls, path: str) -> "BatchJournal":
+        """ Replay a journal; an absent or empty file gives an empty batch """
+        batch = cls(path)
+        for record in batch.journal.records():
+            event = record.get('event')
+            if event == 'batch':
+                batch.files = [tuple(pair) for pair in record['files']]
+                batch.states = [QUEUED] * len(batch.files)
+                batch.options = record.get('options') or {}
+            elif event == 'state' and 0 <= record['index'] < len(batch.states):
+                batch.states[record['index']] = record['state']
+                if record.get('output'):
+                    batch.outputs[record['index']] = record['output']
+            elif event == 'complete':
+                batch.complete = True
+        return batch
+
+    def is_interrupted(self) -> bool:
+        return bool(self.files) and not self.complete
+
+    def pending(self) -> List[int]:
+        """ Indices of the files that still have to be transcoded """
+        return [i for i, state in enumerate(self.states) if state not in (DONE, FAILED, CANCELLED)]
@@ -0,0 +1,219 @@
+import os
+import queue
+import threading
+from pathlib import Path
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from core.config import Config, Logger
+from core.scheduler import TranscodeScheduler
+from core.catalog import MediaCatalog
+from core.probe import ProbeCache, probe_cached
+from core.verify import verify_output
+from core.pipeline import Stage, StageStats
+from core.routing import PresetRouter
+from core.staging import ScratchStage
+from core.governor import LoadGovernor
+from core.priority import CpuSets
+from core.encode_window import EncodeWindow
+from core.journal import Journal
+from core.batch_journal import BatchJournal, RENAMED, ENCODING, DONE, FAILED, CANCELLED
+from core.rename_plan import RenamePlan
+
+class BatchPipeline:
+    """
+    The stages of one batch, wired from the settings: probe ('Probe Workers')
+    -> transcode (TranscodeScheduler, 'Max Workers') -> verify ('Verify
+    Workers') -> cleanup ('Cleanup Workers', deletes originals). Every file's
+    progress is recorded in the BatchJournal so a crashed batch can be resumed.
+    Files enter through put(index, path) (or rename(), which feeds each file as
+    soon as its rename is journaled) and close() ends the input.
+    The callbacks run on worker threads: on_start(job), on_progress(job, percent),
+    on_done(job) for every job the scheduler finishes, on_rejected(job, reason)
+    for an output that failed verification and on_finished(cancelled) once
+    cleanup has drained and the journal is closed.
+    """
+    def __init__(self, batch: BatchJournal, total: int, router: Optional[PresetRouter] = None,
+                 window: Optional[EncodeWindow] = None, catalog: Optional[MediaCatalog] = None,
+                 probe_cache: Optional[ProbeCache] = None, on_start: Optional[Callable] = None,
+                 on_progress: Optional[Callable] = None, on_done: Optional[Callable] = None,
+                 on_rejected: Optional[Callable] = None, on_finished: Optional[Callable] = None):
+        self.logger = Logger.get_logger(__name__)
+        self.batch = batch
+        self.probe_cache = probe_cache
+        self.on_start = on_start
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.on_rejected = on_rejected
+        self.on_finished = on_finished
+        self.output_dir = batch.options.get('output_dir', Config.get("Output Directory"))
+        self.del_original = batch.options.get('del_original', Config.get("Delete Original"))
+        self.verify_outputs = bool(Config.get('Verify Outputs'))
+
+        longest_first = bool(Config.get('Longest Jobs First'))
+        # Every stage, the encode queue included, holds at most this many files before the one feeding it waits
+        capacity = int(Config.get('Stage Queue Size') or 0)
+        self.staging = None
+        if Config.get('Scratch Directory'):
+            # Encode from and to local disk, moving each finished output onto the share in one go
+            self.staging = ScratchStage(Config.get('Scratch Directory'), float(Config.get('Scratch Max GB') or 0) * 1024 ** 3,
+                                        int(Config.get('Prefetch Count') or 0))
+        max_workers = int(Config.get('Max Workers') or 1)
+        governor = LoadGovernor.from_config() if Config.get('Adaptive Workers') else None
+        # One CPU share per allowed encode; the scheduler re-splits them as the governor changes the worker count
+        cpu_sets = CpuSets(max_workers) if Config.get('Pin Worker CPUs') else None
+        self.scheduler = TranscodeScheduler(max_workers=max_workers, on_start=self._started,
+                                            on_progress=on_progress, on_done=self._encoded, on_finished=self._encodes_finished,
+                                            catalog=catalog, longest_first=longest_first,
+                                            timeout=float(Config.get('Encode Timeout') or 0) or None,
+                                            stall_timeout=float(Config.get('Stall Timeout') or 0) or None,
+                                            router=router, staging=self.staging,
+                                            governor=governor, cpu_sets=cpu_sets,
+                                            window=window or None, queue_size=capacity)
+        # Durations decide the order, resolution/codec/bitrate the route; scans are cached by file fingerprint
+        self.needs_scan = (longest_first and total > 1) or bool(router and router.rules)
+
+        # Originals are deleted by the cleanup stage so the encode stage never waits on the share
+        self.probe = Stage("probe", self._probe_one, workers=int(Config.get('Probe Workers') or 4), capacity=capacity,
+                           on_output=lambda item: self.scheduler.submit(item[0], item[1], self.output_dir, media=item[2]),
+                           on_drained=self.scheduler.close)
+        self.cleanup = Stage("cleanup", self._remove_original, workers=int(Config.get('Cleanup Workers') or 1),
+                             capacity=capacity)
+        # Verifying scans each output while the next files encode; only verified originals reach cleanup
+        self.verify = Stage("verify", self._verify_one, workers=int(Config.get('Verify Workers') or 2), capacity=capacity,
+                            on_output=self.cleanup.put, on_drained=self.cleanup.close)
+
+    # ---------------
+    # Control
+    # ---------------
+    def start(self) -> "BatchPipeline":
+        self.scheduler.start(open_queue=True)
+        self.probe.start()
+        self.verify.start()
+        self.cleanup.start()
+        return self
+
+    def put(self, index: int, path: str):
+        """ Queue a file that is ready for probing; blocks while the probe stage is full """
+        if not self.scheduler.cancelled:
+            self.probe.put((index, path))
+
+    def close(self):
+        """ No more files: the batch ends once every stage has drained """
+        self.probe.close()
+
+    def cancel(self):
+        self.probe.cancel()
+        self.scheduler.cancel()
+
+    def rename(self, plan: RenamePlan, pairs: Sequence[Tuple[Path, Path]], journal: Optional[Journal] = None,
+               max_workers: int = 4):
+        """
+        Run the batch's rename plan, feeding every file to the probe stage as
+        soon as its own rename is journaled, and close the input after the
+        last one. The renames never wait for a full probe stage: a feeder
+        thread hands the renamed files on. After a cancel the renames still
+        complete but nothing more is fed or journaled. A failed plan cancels
+        the batch and re-raises (RenameError, OSError).
+        """
+        index_of = {dst: idx for idx, (_, dst) in enumerate(pairs)}
+        unchanged = [idx for idx, (src, dst) in enumerate(pairs) if src == dst]
+        renamed = queue.Queue()
+
+        def feed():
+            while True:
+                item = renamed.get()
+                if item is None:
+                    break
+                self.put(*item)
+            self.close()
+
+        def on_renamed(op):
+            idx = index_of.get(op.dst)
+            if idx is not None and not self.scheduler.cancelled:    # not a cycle's temporary name
+                self.batch.mark([idx], RENAMED)
+                renamed.put((idx, str(op.dst)))
+
+        threading.Thread(target=feed, name="rename-feed", daemon=True).start()
+        if not self.scheduler.cancelled:
+            self.batch.mark(unchanged, RENAMED)
+            for idx in unchanged:
+                renamed.put((idx, str(pairs[idx][1])))
+        try:
+            plan.execute(journal, max_workers=max_workers, on_renamed=on_renamed)
+        except Exception:
+            # Stop the files already under way before the caller offers to roll the renames back
+            self.cancel()
+            raise
+        finally:
+            renamed.put(None)
+
+    def stats(self) -> List[StageStats]:
+        return [self.probe.stats(), self.scheduler.stats(), self.verify.stats(), self.cleanup.stats()]
+
+    # ---------------
+    # Stages
+    # ---------------
+    def _probe_one(self, item):
+        idx, path = item
+        return idx, path, probe_cached(path, self.probe_cache) if self.needs_scan else None
+
+    def _verify_one(self, job):
+        # The source is still in place: originals are only deleted after this stage
+        reason = verify_output(job.output_file, job.media or probe_cached(job.input_file, self.probe_cache))
+        if reason is None:
+            return job if self.del_original else None
+        self.logger.error(f"Output of {job.input_file} failed verification: {reason}; removing {job.output_file}")
+        # A broken output must not count as an earlier encode for the catalog
+        try:
+            os.remove(job.output_file)
+        except OSError as e:
+            self.logger.error(f"Failed to remove {job.output_file}: {e}")
+        job.state, job.error = FAILED, f"output failed verification: {reason}"
+        self.batch.mark([job.job_id], FAILED)
+        if self.on_rejected:
+            self.on_rejected(job, reason)
+        return None
+
+    def _remove_original(self, job):
+        os.remove(job.input_file)
+
+    # ---------------
+    # Scheduler callbacks (on its event loop thread)
+    # ---------------
+    def _started(self, job):
+        self.batch.mark([job.job_id], ENCODING)
+        if self.on_start:
+            self.on_start(job)
+
+    def _encoded(self, job):
+        if job.state in (DONE, FAILED, CANCELLED, "skipped"):
+            # A cancelled file was stopped on purpose: it isn't offered for resuming like an interrupted one
+            self.batch.mark([job.job_id], job.state if job.state in (FAILED, CANCELLED) else DONE, job.output_file)
+        if self.on_done:
+            self.on_done(job)
+        if job.state != DONE:
+            return
+        # A full verify (or cleanup) queue holds the scheduler here, and with it the start of further encodes
+        if self.verify_outputs:
+            self.verify.put(job)
+        elif self.del_original:
+            self.cleanup.put(job)
+
+    def _encodes_finished(self, cancelled: bool):
+        self.probe.cancel()
+        # Finished encodes are still verified and their originals deleted; the batch ends once cleanup drains
+        self.cleanup.on_drained = lambda: self._finish(cancelled)
+        self.verify.close()
+
+    def _finish(self, cancelled: bool):
+        for stats in self.stats():
+            self.logger.info(f"Stage {stats.describe()}, {stats.failed} failed, busy {stats.busy:.1f}s")
+        for preset, metrics in self.scheduler.preset_metrics().items():
+            fps = f", avg {metrics['avg_fps']:.1f} fps" if metrics['avg_fps'] else ""
+            self.logger.info(f"Preset {preset}: {metrics['files']} file(s) in {metrics['seconds']:.0f}s{fps}")
+        if self.staging:
+            self.staging.close()
+        self.batch.finish()
+        self.batch.remove()
+        if self.on_finished:
+            self.on_finished(cancelled)
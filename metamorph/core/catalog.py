@@ -0,0 +1,107 @@
+import os
+import json
+import hashlib
+import threading
+from dataclasses import dataclass, asdict
+from typing import Dict, Optional
+
+from core.journal import Journal
+from core.presets import preset_index, definition_hash
+
+# Bytes hashed from each end of a file for its fingerprint
+PARTIAL_HASH_BYTES = 64 * 1024
+
+_fingerprints: Dict[tuple, str] = {}
+
+def fingerprint(path: str) -> str:
+    """
+    Cheap source fingerprint: size, mtime and a hash of the first and last
+    64 KiB. Survives renames (mtime is kept) but changes when the content does.
+    Remembered per path, size and mtime, so probe and catalog hash a file once.
+    """
+    st = os.stat(path)
+    memo = (path, st.st_size, st.st_mtime_ns)
+    if memo not in _fingerprints:
+        _fingerprints[memo] = _hash_file(path, st)
+    return _fingerprints[memo]
+
+def _hash_file(path: str, st: os.stat_result) -> str:
+    digest = hashlib.sha1()
+    with open(path, 'rb') as file:
+        digest.update(file.read(PARTIAL_HASH_BYTES))
+        if st.st_size > 2 * PARTIAL_HASH_BYTES:
+            file.seek(-PARTIAL_HASH_BYTES, os.SEEK_END)
+            digest.update(file.read(PARTIAL_HASH_BYTES))
+    return f"{st.st_size}:{st.st_mtime_ns}:{digest.hexdigest()[:16]}"
+
+def preset_hash(presets_json: str, preset_name: str) -> str:
+    """ Hash of the preset's definition in the presets JSON (O(1) through the shared preset index) """
+    record = preset_index(presets_json).get(preset_name)
+    # Built-in presets are not in the JSON; only their name identifies them
+    return record.hash if record else definition_hash(preset_name)
+
+@dataclass
+class CatalogEntry:
+    output: str
+    preset: str
+    preset_hash: str
+
+class MediaCatalog:
+    """
+    Persistent map of source fingerprint -> CatalogEntry for every file that
+    was transcoded. Entries are appended to a JSON-lines journal (last one
+    wins) and held in a dict, so lookups are O(1). An entry only matches the
+    preset name and hash it was encoded with, so changing a preset invalidates
+    just the files encoded with it.
+    """
+    def __init__(self, path: str):
+        self.journal = Journal(path)
+        self._entries: Dict[str, CatalogEntry] = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def _load(self):
+        records = 0
+        for record in self.journal.records():
+            records += 1
+            key = record.pop('key', None)
+            if key:
+                self._entries[key] = CatalogEntry(**record)
+        self._loaded = True
+        # Rewrite the file once superseded entries make up most of it
+        if records > 2 * len(self._entries) + 100:
+            self._compact()
+
+    def _compact(self):
+        tmp = self.journal.path + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as file:
+            for key, entry in self._entries.items():
+                file.write(json.dumps({'key': key, **asdict(entry)}, ensure_ascii=False) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        self.journal.close()
+        os.replace(tmp, self.journal.path)
+
+    def lookup(self, key: str, preset: str, preset_hash: str) -> Optional[CatalogEntry]:
+        """ Entry for an unchanged source encoded with this exact preset whose output still exists """
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            entry = self._entries.get(key)
+        if entry and entry.preset == preset and entry.preset_hash == preset_hash and os.path.exists(entry.output):
+            return entry
+        return None
+
+    def record(self, key: str, output: str, preset: str, preset_hash: str):
+        entry = CatalogEntry(output, preset, preset_hash)
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            self._entries[key] = entry
+        self.journal.append({'key': key, **asdict(entry)})
+
+    def __len__(self) -> int:
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            return len(self._entries)
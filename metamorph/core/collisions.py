@@ -0,0 +1,61 @@
+import os
+import platform
+from pathlib import Path
+from collections import Counter
+from typing import Dict, List, Optional, Sequence
+
+from core.fscache import FileStatCache
+
+PENDING = "Pending"
+COLLISION = "Collision"    # target already exists on disk
+DUPLICATE = "Duplicate"    # several rows map to the same target
+
+def default_case_insensitive() -> bool:
+    """ Whether targets should be compared case-insensitively on this platform by default """
+    return platform.system() in ("Windows", "Darwin")
+
+def target_key(path: Path, case_insensitive: bool = False) -> str:
+    """ Normalized comparison key for a path """
+    key = os.path.normpath(os.fspath(path))
+    return key.casefold() if case_insensitive else key
+
+def detect_collisions(sources: Sequence[Path], targets: Sequence[Path], stat_cache: Optional[FileStatCache] = None,
+                      case_insensitive: Optional[bool] = None) -> List[str]:
+    """
+    Return one status per row: PENDING, COLLISION or DUPLICATE.
+    Planned targets and existing directory entries are indexed in hash maps, so
+    the whole list is checked in one linear pass with one scandir per directory.
+    With case_insensitive, "a.mkv" and "A.MKV" count as the same target, as on
+    Windows/SMB shares. A row whose target is its own source never collides with
+    the file on disk (this includes case-only renames), and neither does a target
+    held by another row that moves away: RenamePlan orders such chains and swaps.
+    """
+    if case_insensitive is None:
+        case_insensitive = default_case_insensitive()
+    stat_cache = stat_cache or FileStatCache()
+
+    target_keys = [target_key(t, case_insensitive) for t in targets]
+    planned = Counter(target_keys)
+    # Sources that are renamed to something else free their name during the batch
+    source_keys = [target_key(s, case_insensitive) for s in sources]
+    vacated = {src for src, key in zip(source_keys, target_keys) if src != key}
+    folded_dirs: Dict[str, set] = {}
+
+    def exists(target: Path) -> bool:
+        if not case_insensitive:
+            return stat_cache.exists(target)
+        directory = os.path.dirname(os.fspath(target)) or "."
+        names = folded_dirs.get(directory)
+        if names is None:
+            names = folded_dirs[directory] = {name.casefold() for name in (stat_cache.listing(directory) or ())}
+        return os.path.basename(os.fspath(target)).casefold() in names
+
+    statuses = []
+    for src, target, key in zip(source_keys, targets, target_keys):
+        if planned[key] > 1:
+            statuses.append(DUPLICATE)
+        elif key != src and key not in vacated and exists(target):
+            statuses.append(COLLISION)
+        else:
+            statuses.append(PENDING)
+    return statuses
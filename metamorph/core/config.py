@@ -1,11 +1,12 @@
 import os
-import yaml, json
+import yaml
 import platform
 import logging
 import customtkinter as ctk
 from logging.handlers import RotatingFileHandler
 
 from core.utils import resource_path
+from core.presets import preset_index
 
 class Config:
     @staticmethod
@@ -69,9 +70,43 @@ class Config:
         'HB Presets JSON': r"C:/Program Files (x86)/HandBrake/presets.json" if platform.system() == "Windows" else r"/usr/bin/ghb",
         'HandBrake CLI': r"C:/Program Files (x86)/HandBrake/HandBrakeCLI.exe" if platform.system() == "Windows" else r"/usr/bin/handbrake-cli",
         'HB Preset': "Fast 1080p30",
+        'HB JSON Progress': True,
+        'Preset Routes': [],
         'Output Directory': r"./output",
         'Log Directory': r"./.logs",
+        'Journal Directory': r"./.journal",
+        'Cache Directory': r"./.cache",
+        'Skip Transcoded': True,
         'Delete Original': False,
+        'Parallel Preview Threshold': 20000,
+        'Case Insensitive Targets': platform.system() in ("Windows", "Darwin"),
+        'Rename Workers': 4,
+        'Max Workers': 1,
+        'Adaptive Workers': False,    # let the load governor pick 'Min Workers'..'Adaptive Max Workers'
+        'Min Workers': 1,
+        'Adaptive Max Workers': 0,    # 0 = one per CPU core
+        'Governor Interval': 5,
+        'CPU High %': 90,
+        'CPU Low %': 60,
+        'Memory High %': 90,
+        'IO Wait High %': 20,
+        'Worker Priority': "Below Normal",    # Normal / Below Normal / Idle, CPU and I/O
+        'Pin Worker CPUs': False,
+        'Encode Window': "",    # e.g. "22:00-07:00"; empty = any time
+        'Probe Workers': 4,
+        'Cleanup Workers': 1,
+        'Verify Outputs': True,    # scan every output before its original may be deleted
+        'Verify Workers': 2,
+        'Verify Duration Tolerance %': 2,
+        'Verify Min Size KB': 1024,
+        'Stage Queue Size': 64,    # files a stage may hold before the one feeding it waits
+        'Longest Jobs First': True,
+        'Progress Rate Hz': 5,
+        'Encode Timeout': 0,
+        'Stall Timeout': 600,
+        'Scratch Directory': "",    # local disk for staging encodes of a network library; empty = off
+        'Scratch Max GB': 50,
+        'Prefetch Count': 2,
         'UI Appearance': 'System',
         'UI Accent': 'Blue',
     }
@@ -105,7 +140,6 @@ class Config:
     VERSION = "1.0.0"
 
     _config_file = "settings.conf"
-    _hb_presets = None
     _data = DEFAULTS.copy()
     
     @classmethod
@@ -116,18 +150,12 @@ class Config:
                 cls._data.update(usr_data)
     
     @classmethod
-    def load_hb_presets(cls, json_path=DEFAULTS['HB Presets JSON']):
-        if cls._hb_presets is None:
-            with open(json_path, 'r') as file:
-                data = json.load(file)
-            cls._hb_presets = {}
-            for category in data.get('PresetList', []):
-                cat_name = category['PresetName']
-                cls._hb_presets[cat_name] = {}
-                for preset in category.get('ChildrenArray', []):
-                    preset_name = preset.get('PresetName', "Unknown")
-                    cls._hb_presets[cat_name][preset_name] = preset
-        return cls._hb_presets
+    def load_hb_presets(cls, json_path=None):
+        """
+        {category: {name: PresetRecord}} of the presets JSON (the configured
+        'HB Presets JSON' unless json_path is given), from the shared index.
+        """
+        return preset_index(json_path or cls.get('HB Presets JSON'), cls.get('Cache Directory')).categories
     
     @classmethod
     def save_config(cls):
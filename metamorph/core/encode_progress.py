@@ -0,0 +1,146 @@
+import re
+import json
+from dataclasses import dataclass
+from typing import Optional
+
+# ----- Text mode -----
+# "Encoding: task 1 of 2, 45.23 % (123.45 fps, avg 120.00 fps, ETA 00h01m23s)"
+_TEXT_PROGRESS = re.compile(r'task (\d+) of (\d+), (\d{1,3}\.\d{1,2})\s?%'
+                            r'(?: \((\d+\.\d+) fps, avg (\d+\.\d+) fps, ETA (\d+)h(\d+)m(\d+)s\))?')
+_PERCENT = re.compile(r'(\d{1,3}\.\d{1,2})\s?%')
+
+# ----- JSON mode -----
+# "Progress: {" opens a pretty-printed JSON block that ends when its braces balance
+_BLOCK_START = re.compile(r'^(\w[\w ]*):\s*(\{.*)$')
+_SECTIONS = {"WORKING": "Working", "SCANNING": "Scanning", "MUXING": "Muxing", "WORKDONE": "WorkDone"}
+
+@dataclass
+class EncodeProgress:
+    """ One progress report of HandBrakeCLI; eta is in seconds """
+    state: str = "WORKING"    # SCANNING / WORKING / MUXING / WORKDONE
+    pass_index: int = 1
+    pass_count: int = 1
+    pass_percent: float = 0.0
+    fps: Optional[float] = None
+    avg_fps: Optional[float] = None
+    eta: Optional[int] = None
+
+    @property
+    def percent(self) -> float:
+        """ Progress over all passes, 0-100 """
+        if self.state in ("MUXING", "WORKDONE"):
+            return 100.0
+        if self.state != "WORKING":
+            return 0.0
+        count = max(1, self.pass_count)
+        done = min(max(self.pass_index, 1), count) - 1
+        return (done + self.pass_percent / 100) / count * 100
+
+    def describe(self) -> str:
+        """ Short human readable summary, e.g. "pass 1/2, 123.4 fps, ETA 0:01:23" """
+        parts = []
+        if self.state != "WORKING":
+            parts.append(self.state.lower())
+        if self.pass_count > 1:
+            parts.append(f"pass {self.pass_index}/{self.pass_count}")
+        if self.fps is not None:
+            parts.append(f"{self.fps:.1f} fps")
+        if self.eta is not None:
+            parts.append(f"ETA {self.eta // 3600}:{self.eta // 60 % 60:02}:{self.eta % 60:02}")
+        return ", ".join(parts)
+
+    @classmethod
+    def from_text(cls, line: str) -> Optional["EncodeProgress"]:
+        """ Parse a classic progress line; a bare percent is accepted too """
+        match = _TEXT_PROGRESS.search(line)
+        if match:
+            task, tasks, percent, fps, avg, h, m, s = match.groups()
+            return cls("WORKING", int(task), int(tasks), float(percent),
+                       float(fps) if fps else None, float(avg) if avg else None,
+                       int(h) * 3600 + int(m) * 60 + int(s) if h else None)
+        match = _PERCENT.search(line)
+        if match:
+            return cls(pass_percent=float(match.group(1)))
+        return None
+
+    @classmethod
+    def from_json(cls, data: dict) -> "EncodeProgress":
+        """ Build from a decoded "Progress:" block of HandBrakeCLI --json """
+        state = data.get("State", "WORKING")
+        section = data.get(_SECTIONS.get(state, state.title())) or {}
+        progress = cls(state=state)
+        if "Progress" in section:
+            progress.pass_percent = float(section["Progress"]) * 100
+        if state == "WORKING":
+            progress.pass_index = int(section.get("Pass", 1) or 1)
+            progress.pass_count = int(section.get("PassCount", 1) or 1)
+            progress.fps = section.get("Rate")
+            progress.avg_fps = section.get("RateAvg")
+            eta = section.get("ETASeconds")
+            progress.eta = int(eta) if eta is not None else None
+        return progress
+
+def _brace_delta(line: str) -> int:
+    """ Opening minus closing braces, ignoring those inside JSON strings """
+    if '"' not in line:
+        return line.count('{') - line.count('}')
+    depth, in_string, escaped = 0, False, False
+    for ch in line:
+        if escaped:
+            escaped = False
+        elif ch == '\\':
+            escaped = in_string
+        elif ch == '"':
+            in_string = not in_string
+        elif not in_string:
+            if ch == '{':
+                depth += 1
+            elif ch == '}':
+                depth -= 1
+    return depth
+
+class JsonBlockParser:
+    """
+    Incremental parser for HandBrakeCLI --json output. Feed it one line at a
+    time; it returns (label, data) whenever a "Label: {...}" block completes
+    and None otherwise. Blocks whose label is not in labels are not decoded.
+    """
+    def __init__(self, labels=None):
+        self.labels = labels
+        self._label = None
+        self._lines = []
+        self._depth = 0
+
+    def feed(self, line: str) -> Optional[tuple]:
+        if self._label is None:
+            match = _BLOCK_START.match(line.strip())
+            if not match:
+                return None
+            self._label, line = match.groups()
+            self._lines, self._depth = [], 0
+        self._lines.append(line)
+        self._depth += _brace_delta(line)
+        if self._depth > 0:
+            return None
+        label, text = self._label, "\n".join(self._lines)
+        self._label, self._lines = None, []
+        if self.labels is not None and label not in self.labels:
+            return None
+        try:
+            return label, json.loads(text)
+        except ValueError:
+            return None
+
+class JsonProgressParser(JsonBlockParser):
+    """ JsonBlockParser that turns "Progress:" blocks into EncodeProgress reports """
+    def __init__(self):
+        super().__init__(labels=("Progress",))
+
+    def feed(self, line: str) -> Optional[EncodeProgress]:
+        block = super().feed(line)
+        if block is None:
+            return None
+        try:
+            return EncodeProgress.from_json(block[1])
+        except (ValueError, TypeError, AttributeError):
+            return None
@@ -0,0 +1,45 @@
+import re
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+_SPAN = re.compile(r'^\s*(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})\s*$')
+
+class EncodeWindow:
+    """
+    The hours encodes may run in, from an 'Encode Window' setting such as
+    "22:00-07:00" or "12:00-13:30, 18:00-08:00". A span whose end is before
+    its start runs past midnight. No spans means always open.
+    """
+    def __init__(self, spans: Optional[List[Tuple[int, int]]] = None):
+        self.spans = spans or []    # (start, end) in minutes after midnight
+
+    @classmethod
+    def parse(cls, text: Optional[str]) -> "EncodeWindow":
+        spans = []
+        for part in (text or "").split(","):
+            if not part.strip():
+                continue
+            match = _SPAN.match(part)
+            if not match:
+                raise ValueError(f"expected HH:MM-HH:MM, got '{part.strip()}'")
+            h1, m1, h2, m2 = map(int, match.groups())
+            if h1 > 23 or h2 > 23 or m1 > 59 or m2 > 59:
+                raise ValueError(f"no such time in '{part.strip()}'")
+            spans.append((h1 * 60 + m1, h2 * 60 + m2))
+        return cls(spans)
+
+    def is_open(self, now: Optional[datetime] = None) -> bool:
+        if not self.spans:
+            return True
+        now = now or datetime.now()
+        minute = now.hour * 60 + now.minute
+        for start, end in self.spans:
+            if start <= end:
+                if start <= minute < end:
+                    return True
+            elif minute >= start or minute < end:
+                return True
+        return False
+
+    def __bool__(self):
+        return bool(self.spans)
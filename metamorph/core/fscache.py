@@ -0,0 +1,70 @@
+import os
+from pathlib import Path
+from typing import Dict, Optional
+
+class FileStatCache:
+    """
+    Snapshot of directory contents taken with one os.scandir pass per directory.
+    A directory is re-stat'ed at most once per pass (see revalidate()) and only
+    rescanned when its mtime changed, i.e. when entries were added, removed or
+    renamed. Stat results of individual files are taken once per pass: editing
+    a file in place doesn't change its directory's mtime, so they can't be
+    kept from the snapshot.
+    """
+    def __init__(self):
+        self._dirs: Dict[str, tuple] = {}    # directory -> (mtime_ns, {name: DirEntry})
+        self._checked = set()                # directories validated during the current pass
+        self._stats: Dict[str, Optional[os.stat_result]] = {}    # files stat'ed during the current pass
+
+    def __getstate__(self):
+        # DirEntry objects can't be pickled; a copy sent to a worker process starts empty
+        return {}
+
+    def __setstate__(self, state):
+        self.__init__()
+
+    def revalidate(self):
+        """ Start a new pass: every directory is checked against its mtime again on next use """
+        self._checked.clear()
+        self._stats.clear()
+
+    def clear(self):
+        self._dirs.clear()
+        self._checked.clear()
+        self._stats.clear()
+
+    def listing(self, directory) -> Optional[Dict[str, os.DirEntry]]:
+        """ Return {name: DirEntry} for directory, or None if it can't be read """
+        key = os.fspath(directory)
+        cached = self._dirs.get(key)
+        if key in self._checked:
+            return cached[1] if cached else None
+        self._checked.add(key)
+        try:
+            mtime = os.stat(key).st_mtime_ns
+            if cached and cached[0] == mtime:
+                return cached[1]
+            with os.scandir(key) as it:
+                entries = {entry.name: entry for entry in it}
+        except OSError:
+            self._dirs.pop(key, None)
+            return None
+        self._dirs[key] = (mtime, entries)
+        return entries
+
+    def entry(self, path: Path) -> Optional[os.DirEntry]:
+        entries = self.listing(os.path.dirname(os.fspath(path)) or ".")
+        return entries.get(os.path.basename(os.fspath(path))) if entries else None
+
+    def exists(self, path: Path) -> bool:
+        return self.entry(path) is not None
+
+    def stat(self, path: Path) -> Optional[os.stat_result]:
+        """ Stat result for path as of the current pass, or None if it doesn't exist """
+        key = os.fspath(path)
+        if key not in self._stats:
+            try:
+                self._stats[key] = os.stat(key)
+            except OSError:
+                self._stats[key] = None
+        return self._stats[key]
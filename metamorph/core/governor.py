@@ -0,0 +1,79 @@
+import os
+import asyncio
+import psutil
+from dataclasses import dataclass
+from typing import Optional
+
+from core.config import Config, Logger
+
+@dataclass
+class LoadSample:
+    """ System load over the last interval, all in percent """
+    cpu: float
+    memory: float
+    iowait: float = 0.0    # Linux only; 0 elsewhere
+
+    @classmethod
+    def take(cls) -> "LoadSample":
+        # Both percent calls measure since their previous call, i.e. over the last interval
+        times = psutil.cpu_times_percent(interval=None)
+        return cls(psutil.cpu_percent(interval=None), psutil.virtual_memory().percent, getattr(times, 'iowait', 0.0))
+
+class LoadGovernor:
+    """
+    Adapts the scheduler's worker count to the load of the machine: one
+    more worker while CPU and I/O wait stay low and jobs are waiting, one
+    less when either is high. Under memory pressure the newest encode is
+    suspended (it keeps its memory but stops growing, and the box doesn't
+    swap) and resumed once memory is back below the threshold with margin,
+    or when it is the only encode left.
+    The worker count starts at min_workers (see TranscodeScheduler.start)
+    and stays within min_workers..max_workers.
+    """
+    def __init__(self, min_workers: int = 1, max_workers: int = 1, interval: float = 5.0,
+                 cpu_high: float = 90.0, cpu_low: float = 60.0, memory_high: float = 90.0, iowait_high: float = 20.0):
+        self.logger = Logger.get_logger(__name__)
+        self.min_workers = max(1, int(min_workers))
+        self.max_workers = max(self.min_workers, int(max_workers))
+        self.interval = max(0.5, float(interval))
+        self.cpu_high = cpu_high
+        self.cpu_low = cpu_low
+        self.memory_high = memory_high
+        self.iowait_high = iowait_high
+        self.last: Optional[LoadSample] = None
+
+    @classmethod
+    def from_config(cls) -> "LoadGovernor":
+        return cls(int(Config.get('Min Workers') or 1), int(Config.get('Adaptive Max Workers') or os.cpu_count() or 1),
+                   float(Config.get('Governor Interval') or 5), float(Config.get('CPU High %')),
+                   float(Config.get('CPU Low %')), float(Config.get('Memory High %')), float(Config.get('IO Wait High %')))
+
+    async def run(self, scheduler):
+        """ Sample and adjust every interval until cancelled; runs on the scheduler's loop """
+        LoadSample.take()    # prime the percent counters
+        while True:
+            await asyncio.sleep(self.interval)
+            self.step(scheduler, LoadSample.take())
+
+    def step(self, scheduler, sample: LoadSample):
+        self.last = sample
+        workers = scheduler.max_workers
+        if sample.memory >= self.memory_high and scheduler.active_count():
+            if scheduler.active_count() > 1:
+                job = scheduler.hold_newest()
+                if job:
+                    self.logger.info(f"Memory at {sample.memory:.0f}%, suspending {job.input_file}")
+            workers = max(self.min_workers, min(workers, scheduler.active_count()))
+        elif scheduler.held_count() and (sample.memory < self.memory_high - 10 or not scheduler.active_count()):
+            # Nothing else left running: holding the last encode wouldn't free anything
+            job = scheduler.release_held()
+            if job:
+                self.logger.info(f"Memory at {sample.memory:.0f}%, resuming {job.input_file}")
+        elif sample.cpu >= self.cpu_high or sample.iowait >= self.iowait_high:
+            workers = max(self.min_workers, workers - 1)
+        elif sample.cpu < self.cpu_low and scheduler.pending_count() and not scheduler.held_count():
+            workers = min(self.max_workers, workers + 1)
+        if workers != scheduler.max_workers:
+            self.logger.info(f"CPU {sample.cpu:.0f}%, I/O wait {sample.iowait:.0f}%, "
+                             f"memory {sample.memory:.0f}%: {scheduler.max_workers} -> {workers} workers")
+            scheduler.set_max_workers(workers)
@@ -1,25 +1,85 @@
 import os
 import sys
 import re
+import time
 import psutil
+import shutil
+import asyncio
 import subprocess
-from tkinter import messagebox
 
 from core.config import Config, Logger
+from core.encode_progress import EncodeProgress, JsonProgressParser
+from core.priority import apply_priority
+
+# HandBrakeCLI redraws its progress line with carriage returns
+_LINE_BREAK = re.compile(rb'[\r\n]')
+
+class _LineSplitter:
+    """ Splits binary output chunks into decoded lines on \\r as well as \\n """
+    def __init__(self):
+        self._pending = b""
+
+    def feed(self, chunk: bytes):
+        parts = _LINE_BREAK.split(self._pending + chunk)
+        self._pending = parts.pop()
+        return [part.decode('utf-8', errors='replace') for part in parts if part]
+
+    def flush(self):
+        pending, self._pending = self._pending, b""
+        return [pending.decode('utf-8', errors='replace')] if pending else []
+
+class _Throttle:
+    """
+    Coalesces progress to at most 'Progress Rate Hz' callbacks per second (0 = every update).
+    A held-back update is sent once the interval is up, even if no newer line arrives by then.
+    """
+    def __init__(self, callback, base):
+        rate = float(Config.get('Progress Rate Hz') or 0)
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.callback = callback
+        self.base = base
+        self._last_sent = 0.0
+        self._unsent = None
+        self._timer = None
+
+    def report(self, info: EncodeProgress):
+        now = time.monotonic()
+        if now - self._last_sent >= self.interval:
+            self._send(info, now)
+            return
+        self._unsent = info
+        if self._timer is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                return    # no loop to time it on: sent with the next line or at the end
+            self._timer = loop.call_later(self._last_sent + self.interval - now, self.flush)
+
+    def flush(self):
+        self.cancel()
+        if self._unsent is not None:
+            self._send(self._unsent, time.monotonic())
+
+    def cancel(self):
+        """ Drop the pending trailing update, e.g. once the encode was killed """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _send(self, info: EncodeProgress, now: float):
+        self.cancel()
+        self.callback(info.percent, self.base, info)
+        self._last_sent, self._unsent = now, None
 
 class HandBrake:
     def __init__(self):
         self.logger = Logger.get_logger(__name__)
         self.process = None
-
-    def _extract_percent(self, line):
-        match = re.search(r'(\d{1,3}\.\d{1,2})\s?%', line)
-        if match:
-            try:
-                return float(match.group(1))
-            except ValueError:
-                return None
-        return None
+        self.paused = False
+        self._paused_at = None
+        self._paused_total = 0.0
+        self.priority = Config.get('Worker Priority')
+        self.cpus = None    # CPUs to pin HandBrakeCLI to; None = all
 
     def _parse_filename(self, filename):
         """
@@ -33,24 +93,29 @@ class HandBrake:
             sn_folder = f"Season {season}"    # Preserves leading zero
             return title_with_year.strip(), sn_folder
         return None, None
-    
+
+    def _alive(self):
+        if self.process is None:
+            return False
+        poll = getattr(self.process, 'poll', None)    # subprocess.Popen vs asyncio Process
+        return (poll() if poll else self.process.returncode) is None
+
     def pause(self):
-        if self.process and self.process.poll() is None:
+        if self._alive() and not self.paused:
             psutil.Process(self.process.pid).suspend()
+            self.paused, self._paused_at = True, time.monotonic()
             self.logger.info("HandBrake process paused.")
 
     def resume(self):
-        if self.process and self.process.poll() is None:
+        if self._alive() and self.paused:
             psutil.Process(self.process.pid).resume()
+            self._paused_total += time.monotonic() - self._paused_at
+            self.paused, self._paused_at = False, None
             self.logger.info("HandBrake process resumed.")
-    
-    def transcode(self, input_file, output_dir, progress_callback=None,
-                  done_callback=None, del_original=False, cancel_flag=None):
-        """
-        Run HandBrakeCLI on a file, updating progress via callback.
-        """
+
+    def output_path(self, input_file, output_dir, ext=".mkv"):
+        """ Output file for input_file under output_dir; creates the folders """
         os.makedirs(output_dir, exist_ok=True)
-        # Ensure output file has a safe extension (e.g., mkv)
         base_name, _ = os.path.splitext(os.path.basename(input_file))
         # Determine target directory structure
         show_title, season_dir = self._parse_filename(base_name)
@@ -59,50 +124,170 @@ class HandBrake:
         else:    # Fallback: dump to output_dir directly
             final_dir = output_dir
         os.makedirs(final_dir, exist_ok=True)
-        output_file = os.path.join(final_dir, base_name + ".mkv")
+        return os.path.join(final_dir, base_name + ext)
 
-        # For Windows only: prevent console popups
-        CREATE_NO_WINDOW = 0x08000000
+    def _command(self, input_file, output_dir, preset=None, output_file=None):
+        """ Build (cmd, output_file, json_mode) and create the output folders """
+        # Ensure output file has a safe extension (e.g., mkv)
+        output_file = output_file or self.output_path(input_file, output_dir)
 
         cmd = [
-            Config.get('HandBrake CLI'), 
+            Config.get('HandBrake CLI'),
             "--preset-import-file", Config.get('HB Presets JSON'),
-            "-Z", Config.get('HB Preset'),
+            "-Z", preset or Config.get('HB Preset'),
             "-i", input_file,
             "-o", output_file
         ]
+        # --json reports state, pass, fps and ETA as JSON blocks on stdout (the log stays on stderr)
+        json_mode = bool(Config.get('HB JSON Progress'))
+        if json_mode:
+            cmd.append("--json")
+        return cmd, output_file, json_mode
+
+    def copy_source(self, input_file, output_dir, del_original=False):
+        """ Put the source itself where its encode would go (routes that need no re-encode) """
+        output_file = self.output_path(input_file, output_dir, os.path.splitext(input_file)[1])
+        if del_original:
+            shutil.move(input_file, output_file)
+        else:
+            shutil.copy2(input_file, output_file)
+        return output_file
+
+    def transcode(self, input_file, output_dir, progress_callback=None,
+                  done_callback=None, del_original=False, cancel_flag=None, preset=None):
+        """
+        Run HandBrakeCLI on a file, updating progress via callback.
+        Blocking wrapper around transcode_async; cancel_flag is polled every 100 ms.
+        """
+        asyncio.run(self.transcode_async(input_file, output_dir, progress_callback, done_callback,
+                                         del_original, cancel_flag=cancel_flag, preset=preset))
+
+    async def transcode_async(self, input_file, output_dir, progress_callback=None, done_callback=None,
+                              del_original=False, timeout=None, stall_timeout=None, cancel_flag=None, preset=None,
+                              output_file=None):
+        """
+        Run HandBrakeCLI on a file from an asyncio event loop, with preset
+        (default: the configured 'HB Preset'). output_file overrides the
+        Show (Year)/Season NN path under output_dir, e.g. for a scratch copy.
+        progress_callback(percent, basename, EncodeProgress) gets the overall
+        percent plus pass, fps and ETA when HandBrakeCLI reports them.
+        done_callback(success, input_file, output_file, cancelled, error) is
+        called exactly once. Cancelling the task terminates HandBrakeCLI right
+        away; timeout (seconds of encoding, pauses excluded) and stall_timeout
+        (seconds without any output) kill it and report a failure.
+        """
+        def done(success, output=None, cancelled=False, error=None):
+            if done_callback:
+                done_callback(success=success, input_file=input_file, output_file=output, cancelled=cancelled, error=error)
+
+        cmd, output_file, json_mode = self._command(input_file, output_dir, preset, output_file)
+        parser = JsonProgressParser() if json_mode else None
+        throttle = _Throttle(progress_callback, os.path.basename(input_file)) if progress_callback else None
         self.logger.info(f"Running command: {cmd}")
+
+        # For Windows only: prevent console popups
+        CREATE_NO_WINDOW = 0x08000000
         try:
-            self.process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, encoding="utf-8",
-                                            creationflags=CREATE_NO_WINDOW if sys.platform == "win32" else 0, errors="replace", bufsize=1)
-            for line in self.process.stdout:
-                if cancel_flag and cancel_flag():
-                    self.process.terminate()
-                    if done_callback:
-                        done_callback(success=False, input_file=input_file, output_file=None, cancelled=True)
-                    return
-                
-                percent = self._extract_percent(line)
-                if percent is not None and progress_callback:
-                    base = os.path.basename(input_file)
-                    progress_callback(percent, base)
-            self.process.wait()
-
-            if self.process.returncode == 0:
-                if done_callback:
-                    done_callback(success=True, input_file=input_file, output_file=output_file)
-
-                if del_original:
-                    try:
-                        os.remove(input_file)
-                    except Exception as e:
-                        messagebox.showerror("Error", f"Failed to delete original file: {e}")
-                        self.logger.error(f"Failed to delete original file: {e}")
-            else:
-                if done_callback:
-                    done_callback(success=False, input_file=input_file, output_file=None)
+            self.process = await asyncio.create_subprocess_exec(
+                *cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL if json_mode else subprocess.STDOUT,
+                creationflags=CREATE_NO_WINDOW if sys.platform == "win32" else 0)
         except FileNotFoundError:
-            messagebox.showerror("Error", "HandBrakeCLI not found. Please check the installation path in Config.")
             self.logger.error("HandBrakeCLI not found. Please check the installation path in Config.")
-            if done_callback:
-                done_callback(success=False, input_file=input_file, output_file=None)
+            done(False, error="HandBrakeCLI not found. Please check the installation path in Config.")
+            return
+        if self.cpus or self.priority:
+            apply_priority(self.process.pid, self.priority, self.cpus)
+
+        try:
+            await self._read_output(parser, throttle, timeout, stall_timeout, cancel_flag)
+            returncode = await self.process.wait()
+        except asyncio.CancelledError:
+            await self._kill()
+            done(False, cancelled=True)
+            raise
+        except TimeoutError as e:
+            await self._kill()
+            self.logger.error(f"HandBrakeCLI on {input_file} {e}")
+            done(False, error=f"HandBrakeCLI {e}")
+            return
+        finally:
+            if throttle:
+                throttle.cancel()    # nothing may follow the done callback
+
+        if returncode == 0:
+            done(True, output_file)
+            if del_original:
+                try:
+                    os.remove(input_file)
+                except Exception as e:
+                    self.logger.error(f"Failed to delete original file: {e}")
+        elif cancel_flag and cancel_flag():
+            done(False, cancelled=True)
+        else:
+            done(False, error=f"HandBrakeCLI exited with code {returncode}")
+
+    async def _read_output(self, parser, throttle, timeout, stall_timeout, cancel_flag):
+        """ Feed stdout to the progress parser as it arrives, enforcing the timeouts """
+        splitter = _LineSplitter()
+        stream = self.process.stdout
+        started = last_output = time.monotonic()
+        while True:
+            now = time.monotonic()
+            waits = []
+            if self.paused:
+                last_output = now    # a suspended process is silent on purpose
+                waits.append(1.0)
+            if stall_timeout:
+                waits.append(stall_timeout - (now - last_output))
+            if timeout:
+                waits.append(timeout - self._active_time(started, now))
+            if cancel_flag:
+                waits.append(0.1)
+            try:
+                chunk = await asyncio.wait_for(stream.read(65536), max(0.0, min(waits)) if waits else None)
+            except asyncio.TimeoutError:
+                now = time.monotonic()
+                if cancel_flag and cancel_flag():
+                    await self._kill()
+                    return
+                if timeout and self._active_time(started, now) >= timeout:
+                    raise TimeoutError(f"timed out after {timeout:g}s")
+                if stall_timeout and not self.paused and now - last_output >= stall_timeout:
+                    raise TimeoutError(f"stalled: no output for {stall_timeout:g}s")
+                continue
+            if not chunk:
+                break
+            last_output = time.monotonic()
+            for line in splitter.feed(chunk):
+                self._handle_line(line, parser, throttle)
+            if cancel_flag and cancel_flag():
+                await self._kill()
+                return
+        for line in splitter.flush():
+            self._handle_line(line, parser, throttle)
+        if throttle:
+            throttle.flush()
+
+    def _handle_line(self, line, parser, throttle):
+        info = parser.feed(line) if parser else EncodeProgress.from_text(line)
+        if info is not None and throttle:
+            throttle.report(info)
+
+    def _active_time(self, started, now):
+        paused = self._paused_total + (now - self._paused_at if self._paused_at else 0.0)
+        return now - started - paused
+
+    async def _kill(self):
+        """ Terminate HandBrakeCLI (resuming it first if it is suspended) and reap it """
+        if self._alive():
+            try:
+                if self.paused:
+                    self.resume()
+                self.process.terminate()
+            except (ProcessLookupError, psutil.Error):
+                pass
+        try:
+            await asyncio.wait_for(self.process.wait(), 5)
+        except asyncio.TimeoutError:
+            self.process.kill()
+            await self.process.wait()
@@ -0,0 +1,83 @@
+import os
+import json
+import threading
+from typing import Iterable, Iterator
+
+class Journal:
+    """
+    Append-only JSON-lines journal.
+    Every record is flushed and fsync'd before append() returns, so after a
+    crash the file holds each record that was reported as written. A torn
+    last line (crash mid-write) is ignored when reading back.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        self._lock = threading.Lock()
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def append(self, record: dict):
+        self.append_many([record])
+
+    def append_many(self, records: Iterable[dict]):
+        """ Write several records with a single fsync """
+        lines = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+        if not lines:
+            return
+        with self._lock:
+            if self._file is None:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self._drop_torn_tail()
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(lines)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def _drop_torn_tail(self):
+        """ Cut a partial last line left by a crash so appended records start on a line of their own """
+        try:
+            with open(self.path, 'rb+') as file:
+                end = file.seek(0, os.SEEK_END)
+                if end == 0:
+                    return
+                file.seek(end - 1)
+                if file.read(1) == b'\n':
+                    return
+                pos = end
+                while pos > 0:
+                    step = min(4096, pos)
+                    pos -= step
+                    file.seek(pos)
+                    newline = file.read(step).rfind(b'\n')
+                    if newline != -1:
+                        file.truncate(pos + newline + 1)
+                        return
+                file.truncate(0)
+        except FileNotFoundError:
+            pass
+
+    def records(self) -> Iterator[dict]:
+        if not self.exists():
+            return
+        with open(self.path, 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # Torn write at the end of the file
+                    break
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def remove(self):
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,135 @@
+import time
+import queue
+import threading
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+from core.config import Logger
+
+_CLOSE = object()
+
+@dataclass
+class StageStats:
+    """ Snapshot of one pipeline stage; busy is the summed worker time in seconds """
+    name: str
+    workers: int
+    queued: int = 0
+    active: int = 0
+    done: int = 0
+    failed: int = 0
+    busy: float = 0.0
+    elapsed: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """ Items finished per second since the stage started """
+        return self.done / self.elapsed if self.elapsed > 0 else 0.0
+
+    def describe(self) -> str:
+        return f"{self.name}: {self.queued} queued, {self.active} active, {self.done} done ({self.throughput:.2f}/s)"
+
+class Stage:
+    """
+    One step of a batch pipeline: workers threads take items from a bounded
+    input queue (put() blocks while it is full, so a fast stage can't run
+    arbitrarily far ahead of a slow one), run func(item) and pass every
+    result that isn't None to on_output. After close() the workers drain the
+    queue and exit; the last one calls on_drained. An item whose func raises
+    is counted as failed and handed to on_error(item, exception).
+    """
+    def __init__(self, name: str, func: Callable, workers: int = 1, capacity: int = 0,
+                 on_output: Optional[Callable] = None, on_drained: Optional[Callable] = None,
+                 on_error: Optional[Callable] = None):
+        self.logger = Logger.get_logger(__name__)
+        self.name = name
+        self.func = func
+        self.workers = max(1, int(workers))
+        self.on_output = on_output
+        self.on_drained = on_drained
+        self.on_error = on_error
+        # Room for the close markers, so close() after cancel() never blocks
+        self._queue = queue.Queue(int(capacity) + self.workers if capacity else 0)
+        self._lock = threading.Lock()
+        self._alive = 0
+        self._active = 0
+        self._done = 0
+        self._failed = 0
+        self._busy = 0.0
+        self._started = None
+        self._finished = None
+        self._cancelled = False
+        self._closed = False
+
+    def start(self) -> "Stage":
+        self._started = time.monotonic()
+        self._alive = self.workers
+        for number in range(self.workers):
+            threading.Thread(target=self._work, name=f"{self.name}-{number}", daemon=True).start()
+        return self
+
+    def put(self, item):
+        if not self._cancelled:
+            self._queue.put(item)
+
+    def close(self):
+        """ No more input: workers finish what is queued, then exit """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        for _ in range(self.workers):
+            self._queue.put(_CLOSE)
+
+    def cancel(self):
+        """ Drop everything still queued; items already running finish """
+        self._cancelled = True
+        try:
+            while True:
+                self._queue.get_nowait()
+        except queue.Empty:
+            pass
+        self.close()
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is _CLOSE:
+                break
+            if self._cancelled:
+                continue
+            with self._lock:
+                self._active += 1
+            began = time.monotonic()
+            try:
+                result = self.func(item)
+            except Exception as e:
+                self.logger.error(f"{self.name} stage failed on {item}: {e}")
+                with self._lock:
+                    self._failed += 1
+                if self.on_error:
+                    self.on_error(item, e)
+            else:
+                with self._lock:
+                    self._done += 1
+                if result is not None and self.on_output and not self._cancelled:
+                    self.on_output(result)
+            finally:
+                with self._lock:
+                    self._active -= 1
+                    self._busy += time.monotonic() - began
+        with self._lock:
+            self._alive -= 1
+            last = self._alive == 0
+            if last:
+                self._finished = time.monotonic()
+        if last and self.on_drained:
+            self.on_drained()
+
+    def stats(self) -> StageStats:
+        with self._lock:
+            elapsed = (self._finished or time.monotonic()) - self._started if self._started else 0.0
+            return StageStats(self.name, self.workers, self._queue.qsize(), self._active, self._done, self._failed,
+                              self._busy, elapsed)
+
+def describe_stages(stats: List[StageStats]) -> str:
+    return " | ".join(stage.describe() for stage in stats)
@@ -0,0 +1,154 @@
+import os
+import json
+import hashlib
+import threading
+from dataclasses import dataclass, asdict
+from typing import Dict, Optional
+
+CACHE_VERSION = 1
+
+@dataclass
+class PresetRecord:
+    """ The parts of a HandBrake preset MetaMorph uses; hash covers the full definition """
+    name: str
+    category: str
+    hash: str
+    description: str = ""
+    video_encoder: Optional[str] = None
+    quality: Optional[float] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    file_format: Optional[str] = None
+
+def definition_hash(definition) -> str:
+    return hashlib.sha1(json.dumps(definition, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+def _record(preset: dict, category: str) -> PresetRecord:
+    return PresetRecord(preset.get('PresetName', "Unknown"), category, definition_hash(preset),
+                        preset.get('PresetDescription', ""), preset.get('VideoEncoder'),
+                        preset.get('VideoQualitySlider'), preset.get('PictureWidth'),
+                        preset.get('PictureHeight'), preset.get('FileFormat'))
+
+class PresetIndex:
+    """
+    category -> name -> PresetRecord for a HandBrake presets JSON, plus a
+    flat name -> PresetRecord map for O(1) lookups. Parsing the JSON is slow
+    for large preset files, so the index is persisted as a compact cache
+    keyed by the JSON's path and mtime.
+    """
+    def __init__(self, path: str, mtime_ns: Optional[int] = None):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.categories: Dict[str, Dict[str, PresetRecord]] = {}
+        self.by_name: Dict[str, PresetRecord] = {}
+
+    def get(self, name: str) -> Optional[PresetRecord]:
+        return self.by_name.get(name)
+
+    def _add(self, record: PresetRecord):
+        self.categories.setdefault(record.category, {})[record.name] = record
+        # The first definition of a name wins, as with HandBrakeCLI -Z
+        self.by_name.setdefault(record.name, record)
+
+    @classmethod
+    def parse(cls, path: str, mtime_ns: Optional[int] = None) -> "PresetIndex":
+        index = cls(path, mtime_ns)
+        with open(path, 'r', encoding='utf-8') as file:
+            data = json.load(file)
+        for entry in data.get('PresetList', []):
+            if entry.get('Folder') or 'ChildrenArray' in entry:
+                for preset in entry.get('ChildrenArray', []):
+                    index._add(_record(preset, entry.get('PresetName', "Unknown")))
+            else:    # a preset outside any folder
+                index._add(_record(entry, "Custom"))
+        return index
+
+    # ---------------
+    # Compact cache
+    # ---------------
+    def save(self, cache_path: str):
+        data = {'version': CACHE_VERSION, 'path': os.path.abspath(self.path), 'mtime_ns': self.mtime_ns,
+                'presets': [asdict(record) for presets in self.categories.values() for record in presets.values()]}
+        os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        tmp = cache_path + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as file:
+            json.dump(data, file, separators=(',', ':'))
+        os.replace(tmp, cache_path)
+
+    @classmethod
+    def from_cache(cls, cache_path: str, path: str, mtime_ns: int) -> Optional["PresetIndex"]:
+        """ The cached index, if it was built from this exact file version """
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if (data.get('version') != CACHE_VERSION or data.get('path') != os.path.abspath(path)
+                or data.get('mtime_ns') != mtime_ns):
+            return None
+        index = cls(path, mtime_ns)
+        try:
+            for record in data.get('presets', []):
+                index._add(PresetRecord(**record))
+        except TypeError:
+            return None
+        return index
+
+# ----- Shared index -----
+_lock = threading.Lock()
+_indexes: Dict[tuple, PresetIndex] = {}
+_loading: Dict[tuple, threading.Event] = {}
+
+def _cache_file(cache_dir: str, path: str) -> str:
+    return os.path.join(cache_dir, f"presets-{hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()[:12]}.json")
+
+def preset_index(path: str, cache_dir: Optional[str] = None) -> PresetIndex:
+    """
+    Index of a presets JSON, shared per path and mtime. Loads from the compact
+    cache in cache_dir when it is current, otherwise parses the JSON and
+    refreshes the cache. A missing or unreadable file gives an empty index.
+    If another thread is already loading the same file, waits for it.
+    """
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except OSError:
+        return PresetIndex(path)
+    key = (os.path.abspath(path), mtime_ns)
+    with _lock:
+        if key in _indexes:
+            return _indexes[key]
+        loading = _loading.get(key)
+        if loading is None:
+            loading = _loading[key] = threading.Event()
+            owner = True
+        else:
+            owner = False
+    if not owner:
+        loading.wait()
+        return _indexes.get(key) or PresetIndex(path, mtime_ns)
+
+    try:
+        cache_path = _cache_file(cache_dir, path) if cache_dir else None
+        index = PresetIndex.from_cache(cache_path, path, mtime_ns) if cache_path else None
+        if index is None:
+            try:
+                index = PresetIndex.parse(path, mtime_ns)
+            except (OSError, ValueError, AttributeError):
+                index = PresetIndex(path, mtime_ns)
+            else:
+                if cache_path:
+                    try:
+                        index.save(cache_path)
+                    except OSError:
+                        pass
+        with _lock:
+            _indexes[key] = index
+        return index
+    finally:
+        with _lock:
+            _loading.pop(key, None)
+        loading.set()
+
+def preload_preset_index(path: str, cache_dir: Optional[str] = None):
+    """ Build the index in a background thread so the first lookup doesn't parse on the UI thread """
+    threading.Thread(target=preset_index, args=(path, cache_dir), daemon=True).start()
@@ -0,0 +1,99 @@
+import sys
+import psutil
+import threading
+from typing import Dict, List, Optional
+
+from core.config import Logger
+
+PRIORITY_CLASSES = ("Normal", "Below Normal", "Idle")
+
+def apply_priority(pid: int, priority: Optional[str] = None, cpus: Optional[List[int]] = None):
+    """
+    Pin a process to cpus and lower its CPU and I/O priority to a class of
+    PRIORITY_CLASSES. Whatever the platform doesn't support (affinity on
+    macOS, ionice outside Linux and Windows) is skipped with a warning.
+    """
+    logger = Logger.get_logger(__name__)
+    try:
+        proc = psutil.Process(pid)
+    except psutil.Error:
+        return
+    steps = []
+    if cpus:
+        steps.append(("CPU affinity", lambda: proc.cpu_affinity(list(cpus))))
+    if priority in ("Below Normal", "Idle"):
+        idle = priority == "Idle"
+        if sys.platform == "win32":
+            steps.append(("priority", lambda: proc.nice(psutil.IDLE_PRIORITY_CLASS if idle else psutil.BELOW_NORMAL_PRIORITY_CLASS)))
+            steps.append(("I/O priority", lambda: proc.ionice(psutil.IOPRIO_VERYLOW if idle else psutil.IOPRIO_LOW)))
+        else:
+            steps.append(("priority", lambda: proc.nice(19 if idle else 10)))
+            if sys.platform.startswith("linux"):
+                steps.append(("I/O priority", lambda: proc.ionice(psutil.IOPRIO_CLASS_IDLE) if idle
+                              else proc.ionice(psutil.IOPRIO_CLASS_BE, 7)))
+    elif priority not in (None, "", "Normal"):
+        logger.warning(f"Unknown priority class '{priority}', expected one of {', '.join(PRIORITY_CLASSES)}")
+    for name, step in steps:
+        try:
+            step()
+        except (psutil.Error, AttributeError, OSError, ValueError) as e:
+            logger.warning(f"Cannot set {name} of process {pid}: {e}")
+
+class CpuSets:
+    """
+    Splits the CPUs into slots disjoint shares of (nearly) equal size, one
+    per encode the scheduler currently allows, and hands each starting encode
+    the share the fewest running encodes hold. resize() re-splits the CPUs
+    when the worker count changes and returns the new share of every running
+    encode so it can be re-pinned. Up to slots encodes never share a core;
+    beyond that (or with more slots than CPUs) the least loaded share is
+    doubled up rather than left unpinned.
+    """
+    def __init__(self, slots: int, cpus: Optional[List[int]] = None):
+        if cpus is None:
+            try:
+                cpus = psutil.Process().cpu_affinity()
+            except (psutil.Error, AttributeError):
+                cpus = list(range(psutil.cpu_count() or 1))
+        self.cpus = list(cpus) or [0]
+        self.shares: List[List[int]] = []
+        self._load: List[int] = []
+        self._held: Dict[object, int] = {}
+        self._lock = threading.Lock()
+        self.resize(slots)
+
+    def resize(self, slots: int) -> Dict[object, List[int]]:
+        """ Re-split the CPUs into slots shares; returns the new share of every held key, in acquire order """
+        with self._lock:
+            count = max(1, min(int(slots), len(self.cpus)))
+            if count != len(self.shares):
+                size, extra = divmod(len(self.cpus), count)
+                self.shares = []
+                start = 0
+                for number in range(count):
+                    end = start + size + (1 if number < extra else 0)
+                    self.shares.append(self.cpus[start:end])
+                    start = end
+                self._load = [0] * count
+                for key in self._held:
+                    self._held[key] = self._least_loaded()
+                    self._load[self._held[key]] += 1
+            return {key: self.shares[slot] for key, slot in self._held.items()}
+
+    def _least_loaded(self) -> int:
+        return min(range(len(self.shares)), key=lambda number: self._load[number])
+
+    def acquire(self, key) -> List[int]:
+        with self._lock:
+            if key in self._held:
+                return self.shares[self._held[key]]
+            slot = self._least_loaded()
+            self._load[slot] += 1
+            self._held[key] = slot
+            return self.shares[slot]
+
+    def release(self, key):
+        with self._lock:
+            slot = self._held.pop(key, None)
+            if slot is not None:
+                self._load[slot] -= 1
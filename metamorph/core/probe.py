@@ -0,0 +1,103 @@
+import os
+import sys
+import threading
+import subprocess
+from dataclasses import dataclass, asdict
+from typing import Dict, Optional
+
+from core.config import Config, Logger
+from core.journal import Journal
+from core.catalog import fingerprint
+from core.encode_progress import JsonBlockParser
+
+@dataclass
+class MediaInfo:
+    """ What a HandBrakeCLI --scan tells about a source; duration in seconds, bitrate in bit/s """
+    duration: float
+    width: int
+    height: int
+    video_codec: Optional[str] = None
+    bitrate: Optional[int] = None
+    audio_tracks: Optional[int] = None
+
+def parse_title_set(data: dict, size: Optional[int] = None) -> Optional[MediaInfo]:
+    """ MediaInfo of the main title of a decoded "JSON Title Set" block """
+    titles = data.get('TitleList') or []
+    if not titles:
+        return None
+    main = data.get('MainFeature', 0)
+    title = titles[main] if isinstance(main, int) and 0 <= main < len(titles) else titles[0]
+    span = title.get('Duration') or {}
+    if span.get('Ticks'):
+        duration = span['Ticks'] / 90000    # 90 kHz clock
+    else:
+        duration = span.get('Hours', 0) * 3600 + span.get('Minutes', 0) * 60 + span.get('Seconds', 0)
+    geometry = title.get('Geometry') or {}
+    bitrate = int(size * 8 / duration) if size and duration else None
+    return MediaInfo(float(duration), int(geometry.get('Width', 0)), int(geometry.get('Height', 0)),
+                     title.get('VideoCodec'), bitrate, len(title.get('AudioList') or []))
+
+def probe(path: str) -> Optional[MediaInfo]:
+    """ Run HandBrakeCLI --scan on one file; None when it can't be read """
+    CREATE_NO_WINDOW = 0x08000000
+    cmd = [Config.get('HandBrake CLI'), "--scan", "--json", "-i", path]
+    parser = JsonBlockParser(labels=("JSON Title Set",))
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=300,
+                                creationflags=CREATE_NO_WINDOW if sys.platform == "win32" else 0)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    for line in result.stdout.decode('utf-8', errors='replace').splitlines():
+        block = parser.feed(line)
+        if block:
+            try:
+                return parse_title_set(block[1], os.path.getsize(path))
+            except (OSError, TypeError, ValueError, AttributeError):
+                return None
+    return None
+
+class ProbeCache:
+    """
+    Persistent map of source fingerprint -> MediaInfo, kept in a JSON-lines
+    journal like the MediaCatalog, so every file is only scanned once.
+    """
+    def __init__(self, path: str):
+        self.journal = Journal(path)
+        self._entries: Dict[str, MediaInfo] = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def _load(self):
+        for record in self.journal.records():
+            key = record.pop('key', None)
+            if key:
+                self._entries[key] = MediaInfo(**record)
+        self._loaded = True
+
+    def get(self, key: str) -> Optional[MediaInfo]:
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            return self._entries.get(key)
+
+    def put(self, key: str, info: MediaInfo):
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            self._entries[key] = info
+        self.journal.append({'key': key, **asdict(info)})
+
+def probe_cached(path: str, cache: Optional[ProbeCache] = None) -> Optional[MediaInfo]:
+    """ probe() answered from the cache where the file's fingerprint is known """
+    try:
+        key = fingerprint(path)
+    except OSError:
+        return None
+    info = cache.get(key) if cache else None
+    if info is None:
+        info = probe(path)
+        if info is None:
+            Logger.get_logger(__name__).error(f"Scan of {path} failed")
+        elif cache:
+            cache.put(key, info)
+    return info
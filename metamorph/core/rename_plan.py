@@ -0,0 +1,224 @@
+import os
+import uuid
+from pathlib import Path
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from core.journal import Journal
+from core.collisions import target_key, default_case_insensitive
+
+class RenameError(Exception):
+    """ A rename of the plan failed; the renames completed before it are journaled. """
+    def __init__(self, message: str, failures: List[tuple]):
+        super().__init__(message)
+        self.failures = failures
+
+@dataclass(frozen=True, eq=False)
+class RenameOp:
+    """ One rename; ops hash by identity so plans of 100k+ files schedule quickly """
+    src: Path
+    dst: Path
+
+class RenamePlan:
+    """
+    A whole batch of renames, computed before anything is touched.
+    Operations are grouped into waves: every target of a wave is free once the
+    previous waves are done, so the renames of one wave run concurrently.
+    Chains (a->b, b->c) rename the far end first, and cycles (a->b, b->a) are
+    broken by parking one file under a temporary name.
+    Executed with a Journal, every completed rename is fsync'd to disk so an
+    interrupted batch can be resumed or rolled back.
+    """
+    def __init__(self, pairs: Iterable[Tuple[Path, Path]], case_insensitive: Optional[bool] = None):
+        self.case_insensitive = default_case_insensitive() if case_insensitive is None else case_insensitive
+        as_path = lambda p: p if isinstance(p, Path) else Path(p)
+        ops = [RenameOp(src, dst) for src, dst in ((as_path(s), as_path(d)) for s, d in pairs) if src != dst]
+        self.ops = ops
+        self.waves = self._schedule(ops) if ops else []
+
+    def _key(self, path: Path) -> str:
+        return target_key(path, self.case_insensitive)
+
+    @staticmethod
+    def _temp_name(path: Path) -> Path:
+        return path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.mmtmp")
+
+    def _schedule(self, ops: List[RenameOp]) -> List[List[RenameOp]]:
+        by_src: Dict[str, RenameOp] = {}
+        by_dst: Dict[str, RenameOp] = {}
+        for op in ops:
+            src_key, dst_key = self._key(op.src), self._key(op.dst)
+            if src_key in by_src:
+                raise ValueError(f"File listed twice: {op.src}")
+            if dst_key in by_dst:
+                raise ValueError(f"Duplicate target: {op.dst}")
+            by_src[src_key], by_dst[dst_key] = op, op
+
+        # An op is blocked by the op that still has to move its target out of the way
+        blocker: Dict[RenameOp, RenameOp] = {}
+        for op in ops:
+            holder = by_src.get(self._key(op.dst))
+            if holder is not None and holder is not op:    # a case-only rename isn't blocked by itself
+                blocker[op] = holder
+        dependant = {holder: op for op, holder in blocker.items()}
+
+        # Break cycles: follow blocker links; reaching an op of the current walk closes a cycle
+        state: Dict[RenameOp, int] = {}    # 1 = on the current walk, 2 = finished
+        broken: Set[RenameOp] = set()
+        extra: List[RenameOp] = []
+        for start in ops:
+            walk = []
+            cur = start
+            while cur is not None and cur not in state:
+                state[cur] = 1
+                walk.append(cur)
+                cur = blocker.get(cur)
+            if cur is not None and state[cur] == 1:
+                park = RenameOp(cur.src, self._temp_name(cur.src))
+                final = RenameOp(park.dst, cur.dst)
+                blocked_by_cur = dependant.pop(cur)
+                blocker[blocked_by_cur] = park
+                dependant[park] = blocked_by_cur
+                blocker[final] = blocker.pop(cur)
+                dependant[blocker[final]] = final
+                broken.add(cur)
+                extra += [park, final]
+                walk += [park, final]
+            for op in walk:
+                state[op] = 2
+
+        order = [op for op in ops if op not in broken] + extra
+        # Wave = length of the blocker chain in front of the op
+        wave_of: Dict[RenameOp, int] = {}
+        for op in order:
+            chain = []
+            cur = op
+            while cur is not None and cur not in wave_of:
+                chain.append(cur)
+                cur = blocker.get(cur)
+            depth = wave_of[cur] if cur is not None else -1
+            for link in reversed(chain):
+                depth += 1
+                wave_of[link] = depth
+        waves: List[List[RenameOp]] = [[] for _ in range(max(wave_of.values()) + 1)]
+        for op in order:
+            waves[wave_of[op]].append(op)
+        return waves
+
+    def validate(self):
+        """ Raise FileExistsError if a target exists on disk and isn't vacated by the plan itself """
+        sources = {self._key(op.src) for op in self.ops}
+        for op in self.ops:
+            if self._key(op.dst) not in sources and os.path.lexists(op.dst):
+                raise FileExistsError(f"Target already exists: {op.dst}")
+
+    def targets(self) -> Dict[Path, Path]:
+        """ Map each source to its final path """
+        return {op.src: op.dst for op in self.ops}
+
+    # ---------------
+    # Execution
+    # ---------------
+    def execute(self, journal: Optional[Journal] = None, max_workers: int = 4,
+                on_renamed: Optional[Callable[[RenameOp], None]] = None):
+        """
+        Validate and run the plan, journaling every completed rename.
+        on_renamed(op) is called after each journaled rename, e.g. to hand
+        the file to the next stage of a batch before the whole plan is done.
+        """
+        self.validate()
+        if journal:
+            journal.append({'event': 'plan', 'waves': [[[str(op.src), str(op.dst)] for op in wave] for wave in self.waves]})
+        self._run(journal, set(), max_workers, on_renamed)
+
+    def _run(self, journal: Optional[Journal], done: Set[RenameOp], max_workers: int,
+             on_renamed: Optional[Callable[[RenameOp], None]] = None):
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            for number, wave in enumerate(self.waves):
+                todo = [op for op in wave if op not in done]
+                futures = [(op, pool.submit(os.rename, op.src, op.dst)) for op in todo]
+                failures = []
+                for op, future in futures:
+                    try:
+                        future.result()
+                    except OSError as e:
+                        failures.append((op, e))
+                        continue
+                    if journal:
+                        journal.append({'event': 'done', 'wave': number, 'src': str(op.src), 'dst': str(op.dst)})
+                    if on_renamed:
+                        on_renamed(op)
+                if failures:
+                    op, e = failures[0]
+                    raise RenameError(f"Failed to rename {op.src} -> {op.dst}: {e}", failures)
+        if journal:
+            journal.append({'event': 'complete'})
+
+    # ---------------
+    # Recovery
+    # ---------------
+    @classmethod
+    def _from_journal(cls, journal: Journal) -> Tuple[Optional["RenamePlan"], Dict[RenameOp, int], bool]:
+        """ Rebuild (plan, {done op: wave}, complete) from a journal """
+        plan, done, complete = None, {}, False
+        ops_by_name: Dict[tuple, RenameOp] = {}
+        for record in journal.records():
+            event = record.get('event')
+            if event == 'plan':
+                plan = cls.__new__(cls)
+                plan.case_insensitive = False
+                plan.waves = [[RenameOp(Path(src), Path(dst)) for src, dst in wave] for wave in record['waves']]
+                plan.ops = [op for wave in plan.waves for op in wave]
+                ops_by_name = {(str(op.src), str(op.dst)): op for op in plan.ops}
+            elif event == 'done':
+                op = ops_by_name.get((record['src'], record['dst']))
+                if op is not None:
+                    done[op] = record['wave']
+            elif event in ('complete', 'rolled_back'):
+                complete = True
+        if plan:
+            # A crash between os.rename and the journal write leaves an unrecorded rename behind
+            for number, wave in enumerate(plan.waves):
+                for op in wave:
+                    if op not in done and not os.path.lexists(op.src) and os.path.lexists(op.dst):
+                        done[op] = number
+        return plan, done, complete
+
+    @classmethod
+    def is_interrupted(cls, journal: Journal) -> bool:
+        """ True if the journal holds a plan that neither completed nor was rolled back """
+        if not journal.exists():
+            return False
+        plan, _, complete = cls._from_journal(journal)
+        return plan is not None and not complete
+
+    @classmethod
+    def resume(cls, journal: Journal, max_workers: int = 4):
+        """ Finish the renames of an interrupted plan """
+        plan, done, complete = cls._from_journal(journal)
+        if plan and not complete:
+            plan._run(journal, set(done), max_workers)
+
+    @classmethod
+    def rollback(cls, journal: Journal, max_workers: int = 4):
+        """ Undo every completed rename of the journaled plan, last wave first """
+        plan, done, _ = cls._from_journal(journal)
+        if not plan:
+            return
+        waves: Dict[int, List[RenameOp]] = {}
+        for op, number in done.items():
+            waves.setdefault(number, []).append(op)
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            for number in sorted(waves, reverse=True):
+                futures = [(op, pool.submit(os.rename, op.dst, op.src)) for op in waves[number]]
+                failures = []
+                for op, future in futures:
+                    try:
+                        future.result()
+                    except OSError as e:
+                        failures.append((op, e))
+                if failures:
+                    op, e = failures[0]
+                    raise RenameError(f"Failed to restore {op.src}: {e}", failures)
+        journal.append({'event': 'rolled_back'})
@@ -0,0 +1,73 @@
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional
+
+from core.probe import MediaInfo
+
+# ----- Route actions -----
+ENCODE = "encode"
+COPY = "copy"    # put the source in the output folder as is
+SKIP = "skip"    # leave the file alone
+ACTIONS = (ENCODE, COPY, SKIP)
+
+@dataclass
+class Route:
+    action: str = ENCODE
+    preset: Optional[str] = None
+
+@dataclass
+class RouteRule:
+    """
+    One row of the routing table. Every condition that is set must hold:
+    height range in pixels, video codec names (case-insensitive) and bitrate
+    range in kbit/s. A rule with no conditions matches every file.
+    """
+    preset: Optional[str] = None
+    action: str = ENCODE
+    min_height: Optional[int] = None
+    max_height: Optional[int] = None
+    codecs: List[str] = field(default_factory=list)
+    min_kbps: Optional[float] = None
+    max_kbps: Optional[float] = None
+
+    def __post_init__(self):
+        if self.action not in ACTIONS:
+            raise ValueError(f"Unknown route action: {self.action}")
+        if self.action == ENCODE and not self.preset:
+            raise ValueError("An encode route needs a preset")
+        self.codecs = [codec.lower() for codec in self.codecs]
+
+    def matches(self, media: MediaInfo) -> bool:
+        if self.min_height is not None and media.height < self.min_height:
+            return False
+        if self.max_height is not None and media.height > self.max_height:
+            return False
+        if self.codecs and (media.video_codec or "").lower() not in self.codecs:
+            return False
+        kbps = media.bitrate / 1000 if media.bitrate else None
+        if self.min_kbps is not None and (kbps is None or kbps < self.min_kbps):
+            return False
+        if self.max_kbps is not None and (kbps is None or kbps > self.max_kbps):
+            return False
+        return True
+
+class PresetRouter:
+    """
+    Picks a preset, or copy/skip, per file from its scan data. The first
+    matching rule wins; files without scan data or without a matching rule
+    use the default preset.
+    """
+    def __init__(self, rules: Iterable[RouteRule], default_preset: str):
+        self.rules = list(rules)
+        self.default = Route(ENCODE, default_preset)
+
+    @classmethod
+    def from_config(cls, entries: Optional[list], default_preset: str) -> "PresetRouter":
+        """ Build from the 'Preset Routes' setting: a list of RouteRule field mappings """
+        return cls([RouteRule(**entry) for entry in entries or []], default_preset)
+
+    def route(self, media: Optional[MediaInfo]) -> Route:
+        if media is not None:
+            for rule in self.rules:
+                if rule.matches(media):
+                    return Route(rule.action, rule.preset if rule.action == ENCODE else None)
+        return self.default
@@ -1,9 +1,21 @@
+import os
 import re
+import json
+import hashlib
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, Any, Optional
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, Optional, Callable, List, Iterable
 from dataclasses import dataclass, field
 
+from core.fscache import FileStatCache
+
+# ----- Precompiled Patterns -----
+_TAG = re.compile(r'\{([^{}]+)\}')
+_WIDTH_SUFFIX = re.compile(r'^(.+):(\d+)$')
+_INVALID_CHARS = re.compile(r'[<>:"/\\|?*]')
+
 @dataclass
 class RenameRule:
     """ Data class representing a single renaming rule. """
@@ -20,90 +32,438 @@ def split_name_ext(path: Path):
     """ Split filename into name and extension(s) """
     return path.stem, path.suffix.lstrip('.')
 
-def format_date(path: Path, fmt: str):
+def format_date(path: Path, fmt: str, stat_cache: Optional[FileStatCache] = None):
     """ Format file date based on given format string """
     try:
-        ts = path.stat().st_mtime
-        return datetime.fromtimestamp(ts).strftime(fmt)
+        st = stat_cache.stat(path) if stat_cache else path.stat()
+        return datetime.fromtimestamp(st.st_mtime).strftime(fmt)
     except Exception:
         return datetime.now().strftime(fmt)
     
-def apply_tags(template: str, path: Path, seqnum: int | None = None, metadata: dict | None = None):
-    name, ext = path.stem, path.suffix.lstrip('.')
-    result = template.replace('{name}', name).replace('{ext}', ext)
-    # Date substitution
-    result = re.sub(r'\{date:([^}]+)\}', lambda m: format_date(path, m.group(1)), result)
-
-    # Sequential numbering
-    result = re.sub(r'\{num(?::(\d+))?\}', lambda m: str(seqnum).zfill(int(m.group(1))) if seqnum and m.group(1) else str(seqnum or ''), result)
-
-    # Metadata substitution (standard keys and CSV)
-    if metadata:
-        # Normal metadata fields
-        for key, value in metadata.items():
-            result = re.sub(rf'\{{{re.escape(key)}(?::(\d+))?\}}', lambda m: str(value).zfill(int(m.group(1))) if m.group(1) else str(value), result)
-
-    # CSV column substitution {Csv:1} or {Csv:Header}
-    result = re.sub(r'\{Csv:([^}]+)\}', lambda m: str(metadata.get(f'Csv:{m.group(1)}', '')), result)
-
-    return result
-
-def apply_rule_to_path(rule: RenameRule, path: Path, seqnum: Optional[int]=None, metadata: Optional[Dict[str,Any]]=None) -> Path:
-    original_name = path.stem
-    original_ext = path.suffix
-    target_name = original_name
-    t = rule.type.lower()
+# ---------------
+# Template Compilation
+# ---------------
+# Node kinds of a compiled template
+LITERAL, NAME, EXT, DATE, NUM, FIELD = range(6)
 
-    if t == "replace":
-        old = rule.params.get("old", "")
-        new = rule.params.get("new", "")
-        if rule.params.get("use_tags", False):
-            new = apply_tags(new, path, seqnum)
-        if rule.params.get("case_sensitive", True):
-            target_name = target_name.replace(old, new)
-        else:
-            target_name = re.sub(re.escape(old), new, target_name, flags=re.IGNORECASE)
-
-    elif t == "change_case":
-        mode = rule.params.get("mode", "lower")
-        if mode == "lower":
-            target_name = target_name.lower()
-        elif mode == "upper":
-            target_name = target_name.upper()
-        elif mode == "title":
-            target_name = target_name.title()
-        elif mode == "capitalize":
-            target_name = target_name.capitalize()
-
-    elif t == "prefix_suffix":
-        prefix = rule.params.get("prefix", "")
-        suffix = rule.params.get("suffix", "")
-        if rule.params.get("use_tags", False):
-            prefix = apply_tags(prefix, path, seqnum)
-            suffix = apply_tags(suffix, path, seqnum)
-        target_name = f"{prefix}{target_name}{suffix}"
-
-    elif t == "numbering":
-        template = rule.params.get("template", "{name}_{num:3}")
-        target_name = apply_tags(template, path, seqnum)
-    elif t in ("custom_template", "new_name"):
-        template = rule.params.get("template", "{Csv:1}")
-        target_name = apply_tags(template, path, seqnum, metadata)
-        target_name = sanitize_filename(target_name)
-        new_ext = ""  # extension comes from template, so don’t append original
-        return path.with_name(target_name)
-
-    # extension change
-    new_ext = original_ext
-    if t == "change_ext":
-        new_ext_val = rule.params.get("ext", "")
-        if new_ext_val.startswith("."):
-            new_ext = new_ext_val
-        else:
-            new_ext = "." + new_ext_val if new_ext_val else ""
+class CompiledTemplate:
+    """
+    A tag template tokenized once into literal and tag nodes.
+    Rendering walks the nodes in a single pass, looking metadata
+    fields up by key instead of scanning the template per key.
+    """
+    def __init__(self, template: str):
+        self.template = template
+        self.nodes = []
+        pos = 0
+        for m in _TAG.finditer(template):
+            if m.start() > pos:
+                self.nodes.append((LITERAL, template[pos:m.start()], None))
+            self.nodes.append(self._parse_tag(m.group(1)))
+            pos = m.end()
+        if pos < len(template):
+            self.nodes.append((LITERAL, template[pos:], None))
+        self.is_static = all(kind == LITERAL for kind, _, _ in self.nodes)
+
+    @staticmethod
+    def _parse_tag(body: str):
+        if body == 'name':
+            return (NAME, None, None)
+        if body == 'ext':
+            return (EXT, None, None)
+        if body.startswith('date:'):
+            return (DATE, body[5:], None)
+        if body == 'num':
+            return (NUM, None, None)
+        if body.startswith('num:') and body[4:].isdigit():
+            return (NUM, None, int(body[4:]))
+        # Metadata field: {key} or zero-padded {key:N}
+        m = _WIDTH_SUFFIX.match(body)
+        return (FIELD, body, (m.group(1), int(m.group(2))) if m else None)
+
+    def render(self, path: Path, seqnum: int | None = None, metadata: dict | None = None,
+               stat_cache: Optional[FileStatCache] = None) -> str:
+        if self.is_static:
+            return self.template
+        metadata = metadata or {}
+        out = []
+        for kind, value, arg in self.nodes:
+            if kind == LITERAL:
+                out.append(value)
+            elif kind == NAME:
+                out.append(path.stem)
+            elif kind == EXT:
+                out.append(path.suffix.lstrip('.'))
+            elif kind == DATE:
+                out.append(format_date(path, value, stat_cache))
+            elif kind == NUM:
+                out.append(str(seqnum).zfill(arg) if seqnum and arg is not None else str(seqnum or ''))
+            elif value in metadata:
+                out.append(str(metadata[value]))
+            elif arg and arg[0] in metadata:
+                out.append(str(metadata[arg[0]]).zfill(arg[1]))
+            elif value.startswith('Csv:'):
+                # Unmatched CSV columns render empty
+                out.append('')
+            else:
+                # Unknown tags are left as-is
+                out.append('{' + value + '}')
+        return ''.join(out)
 
-    return path.with_name(sanitize_filename(target_name + new_ext))
+@lru_cache(maxsize=512)
+def compile_template(template: str) -> CompiledTemplate:
+    """ Return the compiled form of template, cached by template string """
+    return CompiledTemplate(template)
+
+def apply_tags(template: str, path: Path, seqnum: int | None = None, metadata: dict | None = None,
+               stat_cache: Optional[FileStatCache] = None):
+    return compile_template(template).render(path, seqnum, metadata, stat_cache)
+
+def apply_rule_to_path(rule: RenameRule, path: Path, seqnum: Optional[int]=None, metadata: Optional[Dict[str,Any]]=None,
+                       stat_cache: Optional[FileStatCache] = None) -> Path:
+    return compile_rule(rule, stat_cache)(path, seqnum, metadata)
 
 def sanitize_filename(name: str) -> str:
     # Replace characters invalid on Windows + generally problematic
-    return re.sub(r'[<>:"/\\|?*]', "_", name)
+    return _INVALID_CHARS.sub("_", name)
+
+# ---------------
+# Rule Compilation
+# ---------------
+# A compiled step takes (path, seqnum, metadata) and returns the renamed Path.
+RuleStep = Callable[[Path, Optional[int], Optional[Dict[str, Any]]], Path]
+
+def _tag_renderer(template: str, stat_cache: Optional[FileStatCache], with_metadata: bool = False):
+    """ Return a (path, seqnum, metadata) -> str renderer backed by the compiled template """
+    compiled = compile_template(template)
+    if compiled.is_static:
+        return lambda path, seqnum, metadata: template
+    if with_metadata:
+        return lambda path, seqnum, metadata: compiled.render(path, seqnum, metadata, stat_cache)
+    return lambda path, seqnum, metadata: compiled.render(path, seqnum, None, stat_cache)
+
+def _finish(path: Path, target_name: str, ext: str) -> Path:
+    return path.with_name(sanitize_filename(target_name + ext))
+
+def _compile_replace(params: Dict[str, Any], stat_cache: Optional[FileStatCache]) -> RuleStep:
+    old = params.get("old", "")
+    new = params.get("new", "")
+    render = _tag_renderer(new, stat_cache) if params.get("use_tags", False) else (lambda path, seqnum, metadata: new)
+    if params.get("case_sensitive", True):
+        def step(path, seqnum, metadata):
+            return _finish(path, path.stem.replace(old, render(path, seqnum, metadata)), path.suffix)
+    else:
+        pattern = compile_pattern(re.escape(old), re.IGNORECASE)
+        def step(path, seqnum, metadata):
+            repl = render(path, seqnum, metadata)
+            return _finish(path, pattern.sub(lambda m: repl, path.stem), path.suffix)
+    return step
+
+def _compile_change_case(params: Dict[str, Any], stat_cache: Optional[FileStatCache]) -> RuleStep:
+    convert = {
+        'lower': str.lower,
+        'upper': str.upper,
+        'title': str.title,
+        'capitalize': str.capitalize,
+    }.get(params.get("mode", "lower"), lambda s: s)
+    return lambda path, seqnum, metadata: _finish(path, convert(path.stem), path.suffix)
+
+def _compile_prefix_suffix(params: Dict[str, Any], stat_cache: Optional[FileStatCache]) -> RuleStep:
+    prefix = params.get("prefix", "")
+    suffix = params.get("suffix", "")
+    if params.get("use_tags", False):
+        render_prefix, render_suffix = _tag_renderer(prefix, stat_cache), _tag_renderer(suffix, stat_cache)
+        return lambda path, seqnum, metadata: _finish(
+            path, f"{render_prefix(path, seqnum, metadata)}{path.stem}{render_suffix(path, seqnum, metadata)}", path.suffix)
+    return lambda path, seqnum, metadata: _finish(path, f"{prefix}{path.stem}{suffix}", path.suffix)
+
+def _compile_numbering(params: Dict[str, Any], stat_cache: Optional[FileStatCache]) -> RuleStep:
+    render = _tag_renderer(params.get("template", "{name}_{num:3}"), stat_cache)
+    return lambda path, seqnum, metadata: _finish(path, render(path, seqnum, metadata), path.suffix)
+
+def _compile_new_name(params: Dict[str, Any], stat_cache: Optional[FileStatCache]) -> RuleStep:
+    # extension comes from template, so don't append original
+    render = _tag_renderer(params.get("template", "{Csv:1}"), stat_cache, with_metadata=True)
+    return lambda path, seqnum, metadata: path.with_name(sanitize_filename(render(path, seqnum, metadata)))
+
+def _compile_change_ext(params: Dict[str, Any], stat_cache: Optional[FileStatCache]) -> RuleStep:
+    new_ext_val = params.get("ext", "")
+    if new_ext_val.startswith("."):
+        new_ext = new_ext_val
+    else:
+        new_ext = "." + new_ext_val if new_ext_val else ""
+    return lambda path, seqnum, metadata: _finish(path, path.stem, new_ext)
+
+@lru_cache(maxsize=256)
+def compile_pattern(pattern: str, flags: int = 0) -> re.Pattern:
+    """ Shared LRU of compiled regexes, keyed by (pattern, flags) """
+    return re.compile(pattern, flags)
+
+def _compile_regex_replace(params: Dict[str, Any], stat_cache: Optional[FileStatCache]) -> RuleStep:
+    pattern = compile_pattern(params.get("pattern", ""), re.IGNORECASE if params.get("ignore_case", False) else 0)
+    repl = params.get("repl", "")
+    return lambda path, seqnum, metadata: _finish(path, pattern.sub(repl, path.stem), path.suffix)
+
+def _compile_insert(params: Dict[str, Any], stat_cache: Optional[FileStatCache]) -> RuleStep:
+    pos = int(params.get("pos", 0))
+    text = params.get("text", "")
+    render = _tag_renderer(text, stat_cache) if params.get("use_tags", False) else (lambda path, seqnum, metadata: text)
+    def step(path, seqnum, metadata):
+        stem = path.stem
+        return _finish(path, stem[:pos] + render(path, seqnum, metadata) + stem[pos:], path.suffix)
+    return step
+
+def _compile_remove(params: Dict[str, Any], stat_cache: Optional[FileStatCache]) -> RuleStep:
+    start = int(params.get("start", 0))
+    end = start + int(params.get("length", 1))
+    return lambda path, seqnum, metadata: _finish(path, path.stem[:start] + path.stem[end:], path.suffix)
+
+def _compile_trim(params: Dict[str, Any], stat_cache: Optional[FileStatCache]) -> RuleStep:
+    side = params.get("side", "both")
+    count = int(params.get("count", 1))
+    left = count if side in ("left", "both") else 0
+    right = count if side in ("right", "both") else 0
+    def step(path, seqnum, metadata):
+        stem = path.stem
+        return _finish(path, stem[left:len(stem) - right] if left + right < len(stem) else "", path.suffix)
+    return step
+
+def _compile_passthrough(params: Dict[str, Any], stat_cache: Optional[FileStatCache]) -> RuleStep:
+    return lambda path, seqnum, metadata: _finish(path, path.stem, path.suffix)
+
+RULE_COMPILERS: Dict[str, Callable[[Dict[str, Any], Optional[FileStatCache]], RuleStep]] = {
+    'replace': _compile_replace,
+    'change_case': _compile_change_case,
+    'prefix_suffix': _compile_prefix_suffix,
+    'numbering': _compile_numbering,
+    'custom_template': _compile_new_name,
+    'new_name': _compile_new_name,
+    'change_ext': _compile_change_ext,
+    'regex_replace': _compile_regex_replace,
+    'insert': _compile_insert,
+    'remove': _compile_remove,
+    'trim': _compile_trim,
+}
+
+def compile_rule(rule: RenameRule, stat_cache: Optional[FileStatCache] = None) -> RuleStep:
+    """ Resolve a rule's type and parameters once into a reusable step function """
+    return RULE_COMPILERS.get(rule.type.lower(), _compile_passthrough)(rule.params, stat_cache)
+
+def validate_rule(rule: RenameRule):
+    """ Compile rule once, raising ValueError for parameters that can't work (e.g. an invalid regex) """
+    t = rule.type.lower()
+    for key in ("pos", "start", "length", "count"):
+        if key in rule.params and int(rule.params[key]) < 0:
+            raise ValueError(f"{key.capitalize()} must not be negative")
+    try:
+        compile_rule(rule)
+    except re.error as e:
+        raise ValueError(f"Invalid regular expression: {e}") from e
+    if t == "regex_replace":
+        if not rule.params.get("pattern"):
+            raise ValueError("Regular expression must not be empty")
+        # Expand the replacement against an empty match with the same groups, so a bad \2 or \g<name> fails here
+        flags = re.IGNORECASE if rule.params.get("ignore_case", False) else 0
+        try:
+            re.compile(rule.params["pattern"] + "\n|", flags).match("").expand(rule.params.get("repl", ""))
+        except (re.error, IndexError) as e:
+            raise ValueError(f"Invalid replacement: {e}") from e
+
+def reads_file_dates(rule: RenameRule) -> bool:
+    """ True if any template of rule has a {date:...} tag, i.e. its result depends on the file's mtime """
+    return any(isinstance(value, str) and any(kind == DATE for kind, _, _ in compile_template(value).nodes)
+               for value in rule.params.values())
+
+def rule_signature(rule: RenameRule) -> str:
+    """ Stable text form of a rule's behaviour (type + parameters) """
+    return json.dumps([rule.type.lower(), rule.params], sort_keys=True, default=str)
+
+class CompiledRuleSet:
+    """
+    A list of RenameRules compiled once for repeated application.
+    Disabled rules are dropped, numbering parameters are parsed and every
+    pattern/template is prepared up front, so run() is a plain loop over steps.
+    Each step also gets a stage key identifying the rule prefix up to it,
+    used by StageCache to reuse intermediate results between previews.
+    A FileStatCache, if given, serves the file dates of {date:...} tags.
+    """
+    def __init__(self, rules: Iterable[RenameRule], stat_cache: Optional[FileStatCache] = None):
+        self.rules: List[RenameRule] = list(rules)
+        self.stat_cache = stat_cache
+        self.reads_dates = False
+        self.steps = []
+        self.stage_keys: List[str] = []
+        self.stage_indexed: List[bool] = []
+        prefix, indexed = "", False
+        for rule in self.rules:
+            if not rule.enabled:
+                continue
+            numbering = None
+            if rule.type.lower() == "numbering":
+                numbering = (int(rule.params.get("start", 1)), int(rule.params.get("increment", 1)))
+                indexed = True
+            self.steps.append((numbering, compile_rule(rule, stat_cache)))
+            self.reads_dates = self.reads_dates or reads_file_dates(rule)
+            prefix = hashlib.sha1((prefix + rule_signature(rule)).encode('utf-8')).hexdigest()
+            self.stage_keys.append(prefix)
+            # Results from the first numbering rule on depend on the file's list position
+            self.stage_indexed.append(indexed)
+
+    def __len__(self):
+        return len(self.steps)
+
+    def stage_key(self, stage: int, index: int):
+        return (self.stage_keys[stage], index) if self.stage_indexed[stage] else self.stage_keys[stage]
+
+    def run(self, path: Path, index: int = 0, metadata: Optional[Dict[str, Any]] = None) -> Path:
+        """ Apply every enabled rule to path, in order """
+        seqnum = None
+        for numbering, step in self.steps:
+            if numbering:
+                start, inc = numbering
+                seqnum = start + index * inc
+            path = step(path, seqnum, metadata)
+        return path
+
+    def run_stages(self, path: Path, index: int = 0, metadata: Optional[Dict[str, Any]] = None,
+                   start: int = 0, seqnum: Optional[int] = None) -> List[tuple]:
+        """ Apply steps from start on and return the (path, seqnum) reached after each of them """
+        stages = []
+        for numbering, step in self.steps[start:]:
+            if numbering:
+                first, inc = numbering
+                seqnum = first + index * inc
+            path = step(path, seqnum, metadata)
+            stages.append((path, seqnum))
+        return stages
+
+class StageCache:
+    """
+    Memo of every file's intermediate result after each rule stage.
+    Entries are keyed by the file, its metadata and the hash of the rule prefix,
+    so after editing or toggling rule k only stages k..n are recomputed,
+    and switching back to an earlier rule list is served from the cache.
+    For rule lists with {date:...} tags the key also holds the file's mtime,
+    so a touched file is renamed afresh.
+    """
+    def __init__(self, max_stages_per_file: int = 64):
+        self.max_stages_per_file = max_stages_per_file
+        self._files: Dict[tuple, Dict[Any, tuple]] = {}
+
+    @staticmethod
+    def _file_key(ruleset: CompiledRuleSet, path: Path, metadata: Optional[Dict[str, Any]]) -> tuple:
+        key = (path, tuple(sorted((k, str(v)) for k, v in metadata.items())) if metadata else ())
+        if not ruleset.reads_dates:
+            return key
+        try:
+            st = ruleset.stat_cache.stat(path) if ruleset.stat_cache else path.stat()
+        except OSError:
+            st = None
+        return key + (st.st_mtime_ns if st else None,)
+
+    def lookup(self, ruleset: CompiledRuleSet, path: Path, index: int, metadata: Optional[Dict[str, Any]] = None) -> tuple:
+        """ Return (stages_done, path, seqnum) for the furthest cached stage of path """
+        entries = self._files.get(self._file_key(ruleset, path, metadata))
+        if entries:
+            for stage in range(len(ruleset) - 1, -1, -1):
+                hit = entries.get(ruleset.stage_key(stage, index))
+                if hit:
+                    return stage + 1, hit[0], hit[1]
+        return 0, path, None
+
+    def store(self, ruleset: CompiledRuleSet, path: Path, index: int, metadata: Optional[Dict[str, Any]],
+              start: int, stages: List[tuple]):
+        entries = self._files.setdefault(self._file_key(ruleset, path, metadata), {})
+        if len(entries) + len(stages) > self.max_stages_per_file:
+            entries.clear()
+        for stage, result in enumerate(stages, start):
+            entries[ruleset.stage_key(stage, index)] = result
+
+    def run(self, ruleset: CompiledRuleSet, path: Path, index: int = 0, metadata: Optional[Dict[str, Any]] = None) -> Path:
+        """ CompiledRuleSet.run(), resuming from the furthest cached stage """
+        done, current, seqnum = self.lookup(ruleset, path, index, metadata)
+        if done == len(ruleset):
+            return current
+        stages = ruleset.run_stages(current, index, metadata, start=done, seqnum=seqnum)
+        self.store(ruleset, path, index, metadata, done, stages)
+        return stages[-1][0]
+
+    def clear(self):
+        self._files.clear()
+
+    def __len__(self):
+        return len(self._files)
+
+# ---------------
+# Batch Application
+# ---------------
+# Lists at least this long are previewed in a process pool
+PARALLEL_THRESHOLD = 20000
+
+def _run_chunk(rules: List[RenameRule], items: List[tuple], stat_cache: Optional[FileStatCache]) -> List[Path]:
+    """ Process-pool worker: compile the rules once and apply them to (index, path, metadata) items """
+    ruleset = CompiledRuleSet(rules, stat_cache)
+    return [ruleset.run(path, index, metadata) for index, path, metadata in items]
+
+def _resume_chunk(rules: List[RenameRule], items: List[tuple], stat_cache: Optional[FileStatCache]) -> List[List[tuple]]:
+    """ Process-pool worker: finish (index, metadata, start, path, seqnum) items and return their stages """
+    ruleset = CompiledRuleSet(rules, stat_cache)
+    return [ruleset.run_stages(path, index, metadata, start, seqnum) for index, metadata, start, path, seqnum in items]
+
+def _map_chunks(func: Callable, rules: List[RenameRule], items: List[tuple], stat_cache: Optional[FileStatCache],
+                parallel_threshold: Optional[int], max_workers: Optional[int]) -> List:
+    """ Run func over items, in order, fanning out to a process pool for long lists """
+    workers = max_workers or os.cpu_count() or 1
+    if parallel_threshold is None or len(items) < parallel_threshold or workers < 2:
+        return func(rules, items, stat_cache)
+
+    chunk_size = -(-len(items) // (workers * 4))
+    chunks = [items[o:o + chunk_size] for o in range(0, len(items), chunk_size)]
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # Each worker gets an empty copy of stat_cache and fills it for its own chunk
+            results = pool.map(func, [rules] * len(chunks), chunks, [stat_cache] * len(chunks))
+            return [result for chunk in results for result in chunk]
+    except (OSError, RuntimeError):
+        # Pool could not be started (frozen app, restricted host ...): stay serial
+        return func(rules, items, stat_cache)
+
+def apply_rules_batch(paths: Iterable[Path], rules: Iterable[RenameRule], metadata_map: Optional[Dict[str, Dict[str, Any]]] = None,
+                      start_index: int = 0, parallel_threshold: Optional[int] = PARALLEL_THRESHOLD,
+                      max_workers: Optional[int] = None, stage_cache: Optional[StageCache] = None,
+                      stat_cache: Optional[FileStatCache] = None) -> List[Path]:
+    """
+    Apply rules to every path and return the target paths in input order.
+    metadata_map is keyed by filename. Path i is numbered as index start_index + i,
+    and every item carries its own index, so {num} sequencing is the same whether
+    the list is processed serially or in chunks above parallel_threshold.
+    With a stage_cache, files resume from their furthest cached rule stage;
+    a stat_cache replaces per-file stat() calls for {date:...} tags.
+    """
+    paths = list(paths)
+    rules = list(rules)
+    metadata_map = metadata_map or {}
+    metadatas = [metadata_map.get(p.name, {}) for p in paths]
+
+    if stage_cache is None:
+        items = [(start_index + i, p, md) for i, (p, md) in enumerate(zip(paths, metadatas))]
+        return _map_chunks(_run_chunk, rules, items, stat_cache, parallel_threshold, max_workers)
+
+    ruleset = CompiledRuleSet(rules, stat_cache)
+    if not len(ruleset):
+        return paths
+    targets = list(paths)
+    pending = []
+    for i, (p, md) in enumerate(zip(paths, metadatas)):
+        done, current, seqnum = stage_cache.lookup(ruleset, p, start_index + i, md)
+        if done == len(ruleset):
+            targets[i] = current
+        else:
+            pending.append((i, done, current, seqnum))
+
+    items = [(start_index + i, metadatas[i], done, current, seqnum) for i, done, current, seqnum in pending]
+    results = _map_chunks(_resume_chunk, rules, items, stat_cache, parallel_threshold, max_workers)
+    for (i, done, _, _), stages in zip(pending, results):
+        stage_cache.store(ruleset, paths[i], start_index + i, metadatas[i], done, stages)
+        targets[i] = stages[-1][0]
+    return targets
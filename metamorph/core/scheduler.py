@@ -0,0 +1,497 @@
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from core.config import Config, Logger
+from core.handbrake import HandBrake
+from core.catalog import MediaCatalog, fingerprint, preset_hash
+from core.encode_progress import EncodeProgress
+from core.probe import MediaInfo
+from core.routing import PresetRouter, Route, ENCODE, COPY, SKIP
+from core.staging import ScratchStage
+from core.governor import LoadGovernor
+from core.priority import CpuSets, apply_priority
+from core.encode_window import EncodeWindow
+from core.pipeline import StageStats
+
+@dataclass
+class TranscodeJob:
+    """ One file queued for HandBrake; job_id identifies the caller's row. """
+    job_id: Any
+    input_file: str
+    output_dir: str
+    del_original: bool = False
+    state: str = "queued"    # queued / encoding / done / skipped / failed / cancelled
+    percent: float = 0.0
+    progress: Optional[EncodeProgress] = None
+    preset: Optional[str] = None
+    media: Optional[MediaInfo] = None
+    output_file: Optional[str] = None
+    error: Optional[str] = None
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    hb: Optional[HandBrake] = field(default=None, repr=False)
+    task: Optional[asyncio.Task] = field(default=None, repr=False)
+
+class TranscodeScheduler:
+    """
+    Runs queued TranscodeJobs on up to max_workers concurrent HandBrakeCLI
+    processes, each job with its own HandBrake instance. All processes are
+    supervised by one asyncio event loop on a single thread; pause(),
+    resume(), cancel() and set_max_workers() may be called from any thread
+    and apply to every running worker within milliseconds.
+    Callbacks run on the loop thread, so they must only hand the event over
+    (e.g. to a queue drained by the UI): on_start(job), on_progress(job,
+    percent), on_done(job) and, once the queue is drained or cancelled,
+    on_finished(cancelled).
+    timeout and stall_timeout (seconds, None = off) fail jobs that encode too
+    long or stop producing output.
+    With a PresetRouter, each job's preset (or copy/skip) is picked from its
+    scan data instead of the global 'HB Preset'.
+    With a MediaCatalog, sources already encoded with the current preset are
+    skipped (state "skipped", output_file set to the earlier output).
+    With longest_first, the queue is started longest job first (by probed
+    duration) so a long file does not end up running alone at the end of the
+    batch; jobs without a duration keep their submitted order behind them.
+    start(open_queue=True) keeps the scheduler running on an empty queue
+    until close(), so an earlier pipeline stage can submit jobs while others
+    encode. With longest_first, an open queue starts nothing until close()
+    or until queue_size jobs are waiting, so the order is decided over the
+    whole batch (or a full queue) rather than whichever job was probed first;
+    later jobs are queued by duration among the waiting ones. With a
+    queue_size, submit() blocks while that many jobs are waiting to start.
+    With a ScratchStage, the next jobs' sources are prefetched to local disk
+    while the current ones encode, HandBrake writes to scratch and the output
+    is moved into its final folder (and the original deleted) only once the
+    encode succeeded.
+    With a LoadGovernor, the worker count follows the machine's load instead
+    of staying at max_workers.
+    With CpuSets, every encode is pinned to its own share of the CPUs, one
+    share per allowed worker; running encodes are re-pinned whenever the
+    worker count changes. With an
+    EncodeWindow, the queue is suspended outside its hours and resumed when
+    it opens again (a pause() by the user still holds).
+    """
+    def __init__(self, max_workers: int = 1, on_start: Optional[Callable] = None, on_progress: Optional[Callable] = None,
+                 on_done: Optional[Callable] = None, on_finished: Optional[Callable] = None,
+                 catalog: Optional[MediaCatalog] = None, longest_first: bool = False,
+                 timeout: Optional[float] = None, stall_timeout: Optional[float] = None,
+                 router: Optional[PresetRouter] = None, staging: Optional[ScratchStage] = None,
+                 governor: Optional[LoadGovernor] = None, cpu_sets: Optional[CpuSets] = None,
+                 window: Optional[EncodeWindow] = None, queue_size: int = 0):
+        self.logger = Logger.get_logger(__name__)
+        self.max_workers = max(1, int(max_workers))
+        self.queue_size = max(0, int(queue_size))
+        self.catalog = catalog
+        self.longest_first = longest_first
+        self.timeout = timeout
+        self.stall_timeout = stall_timeout
+        self.router = router
+        self.staging = staging
+        self.governor = governor
+        self.cpu_sets = cpu_sets
+        self.window = window
+        self.on_start = on_start
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.on_finished = on_finished
+        self.jobs: Dict[Any, TranscodeJob] = {}
+        self._pending: Deque[TranscodeJob] = deque()
+        self._waiting = 0                      # submitted jobs not started yet, incl. those still on their way to _pending
+        self._room = threading.Condition()
+        self._running: Dict[Any, TranscodeJob] = {}
+        self._held: List[TranscodeJob] = []    # suspended by the governor, oldest first
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._paused = False
+        self._window_closed = False
+        self._cancelled = False
+        self._closed = True
+        self._gathering = False    # longest_first on an open queue: hold dispatch until the queue can be sorted
+        self._started: Optional[float] = None
+
+    # ---------------
+    # Queue
+    # ---------------
+    def submit(self, job_id, input_file: str, output_dir: str, del_original: bool = False,
+               media: Optional[MediaInfo] = None) -> TranscodeJob:
+        job = TranscodeJob(job_id, input_file, output_dir, del_original, media=media)
+        self.jobs[job_id] = job
+        with self._room:
+            # Backpressure for the stage feeding the queue; jobs submitted before start() never wait
+            while self.queue_size and self._loop is not None and not self._cancelled and self._waiting >= self.queue_size:
+                self._room.wait()
+            cancelled = self._cancelled
+            if not cancelled:
+                self._waiting += 1
+        if cancelled:    # the loop may be gone already
+            self._finish(job, "cancelled")
+            return job
+        self._call(self._enqueue, job)
+        self._call(self._wake)
+        return job
+
+    def _enqueue(self, job: TranscodeJob):
+        if self._cancelled:
+            self._left_queue(1)
+            self._finish(job, "cancelled")
+            return
+        position = len(self._pending)
+        if self.longest_first and self._loop is not None and job.media:
+            # Submitted while running: in front of the first shorter (or unknown) waiting job
+            position = next((i for i, queued in enumerate(self._pending)
+                             if not queued.media or queued.media.duration < job.media.duration), position)
+        self._pending.insert(position, job)
+        if self._gathering and self.queue_size and len(self._pending) >= self.queue_size:
+            # The feeding stage blocks from here on, so start the longest of the jobs gathered so far
+            self._gathering = False
+
+    def _left_queue(self, count: int):
+        with self._room:
+            self._waiting -= count
+            self._room.notify_all()
+
+    def start(self, open_queue: bool = False):
+        self._closed = not open_queue
+        self._gathering = open_queue and self.longest_first
+        self._started = time.monotonic()
+        if self.governor:
+            # Start small before the first dispatch; the governor adds workers while the machine has room
+            self.max_workers = self.governor.min_workers
+        if self.cpu_sets:
+            self.cpu_sets.resize(self.max_workers)
+        if self.longest_first:
+            # Stable sort: equal or unknown durations keep their submitted order
+            self._pending = deque(sorted(self._pending, key=lambda job: -job.media.duration if job.media else 0.0))
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._run_loop, daemon=True).start()
+
+    def close(self):
+        """ No more submits: finish once the queue drains """
+        self._closed = True
+        self._gathering = False
+        self._call(self._wake)
+
+    def _run_loop(self):
+        try:
+            self._loop.run_until_complete(self._dispatch())
+            self._loop.run_until_complete(self._loop.shutdown_default_executor())
+        finally:
+            self._loop.close()
+
+    @property
+    def paused(self) -> bool:
+        return self._paused
+
+    @property
+    def halted(self) -> bool:
+        """ Paused by the user or outside the encode window """
+        return self._paused or self._window_closed
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    def set_max_workers(self, count: int):
+        self.max_workers = max(1, int(count))
+        if self.cpu_sets:
+            self._call(self._repin)
+        self._call(self._wake)
+
+    def _repin(self):
+        """ Give every running encode its share of the CPUs split for the current worker count """
+        for job_id, cpus in self.cpu_sets.resize(self.max_workers).items():
+            job = self._running.get(job_id)
+            if job is None or job.hb is None:
+                continue
+            job.hb.cpus = cpus    # not spawned yet: HandBrake pins itself on start
+            if job.hb.process is not None:
+                apply_priority(job.hb.process.pid, cpus=cpus)
+
+    def _call(self, func, *args):
+        """ Run func on the loop thread (directly before start()) """
+        if self._loop is None:
+            func(*args)
+        elif not self._loop.is_closed():
+            try:
+                self._loop.call_soon_threadsafe(func, *args)
+            except RuntimeError:    # loop closed in the meantime
+                pass
+
+    def _wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _dispatch(self):
+        self._wakeup = asyncio.Event()
+        helpers = []
+        if self.governor:
+            helpers.append(asyncio.create_task(self.governor.run(self)))
+        if self.window:
+            self._window_closed = not self.window.is_open()
+            if self._window_closed:
+                self.logger.info("Outside the encode window, waiting for it to open.")
+            helpers.append(asyncio.create_task(self._watch_window()))
+        while not self._cancelled and (self._pending or self._running or not self._closed):
+            while not self.halted and not self._gathering and self._pending and len(self._running) < self.max_workers:
+                job = self._pending.popleft()
+                self._left_queue(1)
+                self._running[job.job_id] = job
+                job.task = asyncio.create_task(self._run_job(job))
+            self._wakeup.clear()
+            await self._wakeup.wait()
+        for helper in helpers:
+            helper.cancel()
+        # After a cancel, wait for the terminated workers to report back
+        tasks = [job.task for job in self._running.values()] + helpers
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        if self.on_finished:
+            self.on_finished(cancelled=self._cancelled)
+
+    async def _run_job(self, job: TranscodeJob):
+        try:
+            route = self.router.route(job.media) if self.router else Route(ENCODE, Config.get('HB Preset'))
+            job.preset = route.preset
+            if route.action == SKIP:
+                self._skip(job, None, "routed to skip")
+                return
+            if route.action == COPY:
+                job.started = time.monotonic()
+                output = await asyncio.to_thread(HandBrake().copy_source, job.input_file, job.output_dir, job.del_original)
+                self._finish(job, "done", output)
+                return
+            # Fingerprinting reads the file, so it runs off the loop thread
+            key, preset_id = await asyncio.to_thread(self._catalog_key, job)
+            entry = self.catalog.lookup(key, job.preset, preset_id) if key else None
+            if entry:
+                self._skip(job, entry.output, f"already transcoded to {entry.output}")
+                return
+            await self._transcode(job, key, preset_id)
+        except asyncio.CancelledError:
+            if job.finished is None:
+                self._finish(job, "cancelled")
+        except Exception as e:
+            self.logger.error(f"Transcode of {job.input_file} failed: {e}")
+            if job.finished is None:
+                self._finish(job, "failed", error=str(e))
+        finally:
+            if self.staging:
+                self.staging.release(job.input_file)    # prefetched but routed away or skipped
+            self._running.pop(job.job_id, None)
+            if job in self._held:
+                self._held.remove(job)
+            if self.cpu_sets:
+                self.cpu_sets.release(job.job_id)
+            self._wake()
+
+    def _catalog_key(self, job: TranscodeJob):
+        """ (source fingerprint, preset hash) of the job's preset, or Nones without a catalog """
+        if self.catalog is None:
+            return None, None
+        try:
+            key = fingerprint(job.input_file)
+        except OSError as e:
+            self.logger.error(f"Cannot fingerprint {job.input_file}: {e}")
+            return None, None
+        return key, preset_hash(Config.get('HB Presets JSON'), job.preset)
+
+    def _skip(self, job: TranscodeJob, output_file: Optional[str], reason: str):
+        self.logger.info(f"Skipping {job.input_file}: {reason}")
+        job.started = time.monotonic()
+        job.percent = 100.0
+        self._finish(job, "skipped", output_file)
+
+    def _finish(self, job: TranscodeJob, state: str, output_file: Optional[str] = None, error: Optional[str] = None):
+        job.finished = time.monotonic()
+        job.state = state
+        job.output_file = output_file
+        job.error = error
+        if self.on_done:
+            self.on_done(job)
+
+    async def _transcode(self, job: TranscodeJob, key: Optional[str], preset_id: Optional[str]):
+        job.hb = HandBrake()
+        if self.cpu_sets:
+            job.hb.cpus = self.cpu_sets.acquire(job.job_id)
+        job.state = "encoding"
+        job.started = time.monotonic()
+        if self.on_start:
+            self.on_start(job)
+        if not self.staging:
+            await self._encode(job, key, preset_id, job.input_file)
+            return
+
+        scratch = None
+        try:
+            for upcoming in list(self._pending)[:self.staging.prefetch_count]:
+                await asyncio.to_thread(self.staging.prefetch, upcoming.input_file)
+            source = await self.staging.local_input(job.input_file)
+            if source is None:    # doesn't fit in the scratch space
+                await self._encode(job, key, preset_id, job.input_file)
+                return
+            final = await asyncio.to_thread(job.hb.output_path, job.input_file, job.output_dir)
+            scratch = self.staging.scratch_output(final)
+            await self._encode(job, key, preset_id, source, scratch, final)
+        finally:
+            self.staging.release(job.input_file, scratch)
+
+    async def _encode(self, job: TranscodeJob, key: Optional[str], preset_id: Optional[str], source: str,
+                      scratch: Optional[str] = None, final: Optional[str] = None):
+        """ Run HandBrake on source; a scratch output is moved to final before the job counts as done """
+
+        def progress(percent, _base, info=None):
+            job.percent = percent
+            job.progress = info
+            # A job that was still starting up when pause() ran is suspended here
+            if self.halted:
+                job.hb.pause()
+            if self.on_progress:
+                self.on_progress(job, percent)
+
+        result = {}
+
+        def done(success, input_file, output_file, cancelled=False, error=None):
+            result.update(success=success, output_file=output_file, cancelled=cancelled, error=error)
+
+        await job.hb.transcode_async(source, job.output_dir, progress_callback=progress, done_callback=done,
+                                     del_original=job.del_original and scratch is None, timeout=self.timeout,
+                                     stall_timeout=self.stall_timeout, preset=job.preset, output_file=scratch)
+        success, output_file, error = result.get('success'), result.get('output_file'), result.get('error')
+        if success and scratch:
+            try:
+                await asyncio.to_thread(self.staging.commit, scratch, final)
+            except OSError as e:
+                self.logger.error(f"Moving {scratch} to {final} failed: {e}")
+                success, output_file, error = False, None, f"Moving the output into place failed: {e}"
+            else:
+                output_file = final
+                if job.del_original:
+                    await asyncio.to_thread(self._remove_original, job)
+        if success and key:
+            self.catalog.record(key, output_file, job.preset, preset_id)
+        state = "done" if success else "cancelled" if result.get('cancelled') or self._cancelled else "failed"
+        self._finish(job, state, output_file, error)
+
+    def _remove_original(self, job: TranscodeJob):
+        try:
+            os.remove(job.input_file)
+        except OSError as e:
+            self.logger.error(f"Failed to delete original file: {e}")
+
+    def stats(self) -> StageStats:
+        """ The encode stage in the same terms as the other pipeline stages """
+        jobs = list(self.jobs.values())
+        ended = [job for job in jobs if job.finished is not None and job.started is not None]
+        return StageStats("transcode", self.max_workers, len(self._pending), len(self._running),
+                          sum(job.state in ("done", "skipped") for job in ended),
+                          sum(job.state == "failed" for job in ended),
+                          sum(job.finished - job.started for job in ended),
+                          time.monotonic() - self._started if self._started else 0.0)
+
+    def preset_metrics(self) -> Dict[str, dict]:
+        """ Encode throughput per preset over the finished jobs: files, seconds and mean average fps """
+        metrics: Dict[str, dict] = {}
+        for job in list(self.jobs.values()):
+            if job.state != "done" or job.started is None or job.preset is None:
+                continue
+            entry = metrics.setdefault(job.preset, {'files': 0, 'seconds': 0.0, 'avg_fps': None, '_fps': []})
+            entry['files'] += 1
+            entry['seconds'] += job.finished - job.started
+            if job.progress and job.progress.avg_fps:
+                entry['_fps'].append(job.progress.avg_fps)
+        for entry in metrics.values():
+            fps = entry.pop('_fps')
+            entry['avg_fps'] = sum(fps) / len(fps) if fps else None
+        return metrics
+
+    # ---------------
+    # Control
+    # ---------------
+    def pause(self):
+        self._paused = True
+        self._call(self._pause_running)
+
+    def _pause_running(self):
+        for job in list(self._running.values()):
+            if job.hb:
+                job.hb.pause()
+
+    def resume(self):
+        self._paused = False
+        self._call(self._resume_running)
+
+    def _resume_running(self):
+        if self._window_closed:    # the window reopening resumes them
+            return
+        for job in list(self._running.values()):
+            if job.hb and job not in self._held:
+                job.hb.resume()
+        self._wake()
+
+    # ----- Load governor (loop thread only) -----
+    def active_count(self) -> int:
+        """ Running encodes that are not suspended by the governor """
+        return len(self._running) - len(self._held)
+
+    def held_count(self) -> int:
+        return len(self._held)
+
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def hold_newest(self) -> Optional[TranscodeJob]:
+        """ Suspend the most recently started encode that is still running """
+        candidates = [job for job in self._running.values()
+                      if job.state == "encoding" and job.hb and job.hb.process and job not in self._held]
+        if not candidates:
+            return None
+        job = max(candidates, key=lambda job: job.started)
+        job.hb.pause()
+        self._held.append(job)
+        return job
+
+    def release_held(self) -> Optional[TranscodeJob]:
+        """ Resume the encode that was held first (it stays suspended while the queue is paused) """
+        if not self._held:
+            return None
+        job = self._held.pop(0)
+        if not self.halted:
+            job.hb.resume()
+        return job
+
+    async def _watch_window(self):
+        """ Suspend the queue while the encode window is closed """
+        while True:
+            closed = not self.window.is_open()
+            if closed != self._window_closed:
+                self._window_closed = closed
+                if closed:
+                    self.logger.info("Outside the encode window, suspending the queue.")
+                    self._pause_running()
+                else:
+                    self.logger.info("Encode window open, resuming the queue.")
+                    if not self._paused:
+                        self._resume_running()
+            await asyncio.sleep(30)
+
+    def cancel(self):
+        self._cancelled = True
+        with self._room:
+            self._room.notify_all()    # blocked submit() calls return the job as cancelled
+        self._call(self._cancel_running)
+
+    def _cancel_running(self):
+        # Jobs that never started end as cancelled too, so every submitted job gets its on_done
+        pending, self._pending = self._pending, deque()
+        self._left_queue(len(pending))
+        for job in pending:
+            self._finish(job, "cancelled")
+        for job in list(self._running.values()):
+            if job.task:
+                job.task.cancel()
+        self._wake()
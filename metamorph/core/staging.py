@@ -0,0 +1,156 @@
+import os
+import uuid
+import shutil
+import asyncio
+import hashlib
+import threading
+from dataclasses import dataclass, field
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Optional
+
+from core.config import Logger
+
+_CHUNK = 1024 * 1024
+
+@dataclass
+class _Staged:
+    source: str
+    size: int
+    folder: str
+    local: str
+    future: Optional[Future] = field(default=None, repr=False)
+    dropped: bool = False
+
+class ScratchStage:
+    """
+    Local-disk staging area for libraries on a network share. prefetch()
+    copies upcoming sources into root/inputs in the background, HandBrake
+    reads the local copy and writes to scratch_output(), and commit() moves
+    the finished file into its final folder in one rename. Every staged job
+    reserves twice its source size (input copy + output) and jobs that would
+    push the reservations past max_bytes are not staged at all; they run
+    straight against the share as before. Leftovers of an earlier run are
+    removed on start.
+    """
+    def __init__(self, root: str, max_bytes: int, prefetch_count: int = 2):
+        self.logger = Logger.get_logger(__name__)
+        self.root = os.path.abspath(root)
+        self.max_bytes = max(0, int(max_bytes))
+        self.prefetch_count = max(0, int(prefetch_count))
+        self.reserved = 0
+        self._staged: Dict[str, _Staged] = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max(1, self.prefetch_count), thread_name_prefix="prefetch")
+        for sub in ("inputs", "outputs"):
+            shutil.rmtree(os.path.join(self.root, sub), ignore_errors=True)
+
+    # ---------------
+    # Inputs
+    # ---------------
+    def prefetch(self, source: str) -> bool:
+        """ Start copying source to local disk unless it is staged already; False if it doesn't fit """
+        with self._lock:
+            if source in self._staged:
+                return True
+        try:
+            size = os.path.getsize(source)
+        except OSError:
+            return False
+        with self._lock:
+            if source in self._staged:
+                return True
+            if self.reserved + 2 * size > self.max_bytes:
+                return False
+            self.reserved += 2 * size
+            name = hashlib.sha1(os.path.abspath(source).encode('utf-8')).hexdigest()[:12]
+            folder = os.path.join(self.root, "inputs", name)
+            staged = self._staged[source] = _Staged(source, size, folder, os.path.join(folder, os.path.basename(source)))
+            staged.future = self._pool.submit(self._copy, staged)
+        return True
+
+    def _copy(self, staged: _Staged):
+        os.makedirs(staged.folder, exist_ok=True)
+        partial = staged.local + ".part"
+        with open(staged.source, 'rb') as src, open(partial, 'wb') as dst:
+            while not staged.dropped:
+                chunk = src.read(_CHUNK)
+                if not chunk:
+                    break
+                dst.write(chunk)
+        if staged.dropped:
+            return
+        shutil.copystat(staged.source, partial)
+        os.replace(partial, staged.local)
+
+    async def local_input(self, source: str) -> Optional[str]:
+        """ The local copy of source once it is complete (staging it now if needed); None to use the source """
+        if not await asyncio.to_thread(self.prefetch, source):
+            return None
+        staged = self._staged.get(source)
+        if staged is None:    # released in the meantime
+            return None
+        try:
+            await asyncio.wrap_future(staged.future)
+        except OSError as e:
+            self.logger.error(f"Staging {source} failed, reading it in place: {e}")
+            self.release(source)
+            return None
+        return staged.local
+
+    # ---------------
+    # Outputs
+    # ---------------
+    def scratch_output(self, final: str) -> str:
+        """ Where to encode the file that ends up at final """
+        folder = os.path.join(self.root, "outputs", uuid.uuid4().hex[:8])
+        os.makedirs(folder, exist_ok=True)
+        return os.path.join(folder, os.path.basename(final))
+
+    def commit(self, scratch: str, final: str):
+        """
+        Move a finished scratch output to final. Across devices it is copied
+        next to final as a hidden .part file first, so final never exists
+        half-written even if the share drops mid-copy.
+        """
+        try:
+            os.replace(scratch, final)
+            return
+        except OSError:
+            if not os.path.exists(scratch):
+                raise
+        partial = os.path.join(os.path.dirname(final), f".{os.path.basename(final)}.part")
+        try:
+            with open(scratch, 'rb') as src, open(partial, 'wb') as dst:
+                shutil.copyfileobj(src, dst, _CHUNK)
+                dst.flush()
+                os.fsync(dst.fileno())
+            os.replace(partial, final)
+        except OSError:
+            try:
+                os.remove(partial)
+            except OSError:
+                pass
+            raise
+        os.remove(scratch)
+
+    # ---------------
+    # Cleanup
+    # ---------------
+    def release(self, source: str, scratch: Optional[str] = None):
+        """ Drop the local copy of source (and the scratch output's folder) and free its reservation """
+        if scratch:
+            shutil.rmtree(os.path.dirname(scratch), ignore_errors=True)
+        with self._lock:
+            staged = self._staged.pop(source, None)
+            if staged is None:
+                return
+            self.reserved -= 2 * staged.size
+        staged.dropped = True    # a running copy stops at its next chunk
+        staged.future.cancel()
+        staged.future.add_done_callback(lambda _: shutil.rmtree(staged.folder, ignore_errors=True))
+
+    def close(self):
+        """ Stop prefetching and remove everything still staged """
+        for source in list(self._staged):
+            self.release(source)
+        self._pool.shutdown(wait=False, cancel_futures=True)
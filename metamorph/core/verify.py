@@ -0,0 +1,34 @@
+import os
+from typing import Optional
+
+from core.config import Config
+from core.probe import MediaInfo, probe
+
+def verify_output(output_file: str, source: Optional[MediaInfo] = None) -> Optional[str]:
+    """
+    Why output_file is not a usable encode, or None if it checks out: it must
+    be at least 'Verify Min Size KB', readable by HandBrakeCLI --scan, have a
+    video track, keep an audio track if the source had one, and last as long
+    as the source within 'Verify Duration Tolerance %' (at least 2 seconds).
+    """
+    try:
+        size = os.path.getsize(output_file)
+    except OSError as e:
+        return f"output is missing: {e}"
+    min_bytes = float(Config.get('Verify Min Size KB') or 0) * 1024
+    if size < min_bytes:
+        return f"output is only {size} bytes"
+    output = probe(output_file)
+    if output is None:
+        return "HandBrakeCLI cannot read the output"
+    if not output.width or not output.height:
+        return "output has no video track"
+    if source is None:
+        return None
+    if source.audio_tracks and not output.audio_tracks:
+        return "output has no audio track"
+    if source.duration:
+        allowed = max(2.0, source.duration * float(Config.get('Verify Duration Tolerance %') or 0) / 100)
+        if abs(output.duration - source.duration) > allowed:
+            return f"output runs {output.duration:.0f}s, source {source.duration:.0f}s"
+    return None
@@ -1,4 +1,5 @@
 import threading, time
+import multiprocessing
 import customtkinter as ctk
 from PIL import Image
 
@@ -51,6 +52,8 @@ class SplashScreen:
             app.mainloop()
 
 if __name__ == "__main__":
+    # Needed by the preview process pool in frozen (PyInstaller) builds
+    multiprocessing.freeze_support()
     root = ctk.CTk()
     SplashScreen(root)
     root.mainloop()
\ No newline at end of file
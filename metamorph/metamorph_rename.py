@@ -0,0 +1,130 @@
+"""
+metamorph-rename: headless rename runner for MetaMorph rule sets.
+
+Usage:
+    python metamorph_rename.py RULES [PATH ...] [--recursive] [--metadata FILE] [--apply]
+
+RULES is a YAML or JSON file holding either a list of rules or a mapping with
+"rules" (and optionally "metadata", keyed by filename). Each rule has the same
+fields as core.rules.RenameRule: type, params, enabled, name.
+
+Paths are read from the arguments (directories are walked) or, when none are
+given or PATH is "-", one per line from stdin. Every file streams through the
+pipeline on its own, so memory use does not grow with the number of files.
+The plan is written as "old<TAB>new" lines; with --apply the renames are performed.
+
+Only core.rules is imported: no Tk, customtkinter or PIL.
+"""
+import os
+import sys
+import json
+import argparse
+from pathlib import Path
+from typing import Iterable, Iterator, Tuple
+
+from core.rules import RenameRule, CompiledRuleSet, validate_rule
+
+def load_document(path: str):
+    """ Load a YAML or JSON document (yaml is only imported when needed) """
+    with open(path, 'r', encoding='utf-8') as file:
+        if path.lower().endswith('.json'):
+            return json.load(file)
+        import yaml
+        return yaml.safe_load(file)
+
+def load_rule_set(path: str) -> Tuple[list, dict]:
+    """ Return (rules, metadata) from a rule set file """
+    data = load_document(path) or []
+    metadata = {}
+    if isinstance(data, dict):
+        metadata = data.get('metadata') or {}
+        data = data.get('rules') or []
+    rules = []
+    for entry in data:
+        rule = RenameRule(type=entry['type'], params=entry.get('params') or {},
+                          enabled=entry.get('enabled', True), name=entry.get('name', ""))
+        validate_rule(rule)
+        rules.append(rule)
+    return rules, metadata
+
+def iter_input_paths(sources: Iterable[str], recursive: bool = False) -> Iterator[Path]:
+    """ Yield files from arguments, directories and stdin, one at a time """
+    for source in sources:
+        if source == '-':
+            for line in sys.stdin:
+                line = line.rstrip('\r\n')
+                if line:
+                    yield Path(line)
+        elif os.path.isdir(source):
+            yield from iter_directory(source, recursive)
+        else:
+            yield Path(source)
+
+def iter_directory(directory: str, recursive: bool = False) -> Iterator[Path]:
+    """ Walk a directory in sorted order without building the full tree in memory """
+    with os.scandir(directory) as it:
+        entries = sorted(it, key=lambda e: e.name)
+    for entry in entries:
+        if entry.is_file():
+            yield Path(entry.path)
+        elif recursive and entry.is_dir(follow_symlinks=False):
+            yield from iter_directory(entry.path, recursive)
+
+def plan_renames(paths: Iterable[Path], ruleset: CompiledRuleSet, metadata: dict,
+                 start_index: int = 0) -> Iterator[Tuple[Path, Path]]:
+    """ Yield (old, new) for every path, numbered in stream order """
+    for index, path in enumerate(paths, start_index):
+        yield path, ruleset.run(path, index, metadata.get(path.name, {}))
+
+def apply_renames(plan: Iterable[Tuple[Path, Path]]) -> Iterator[Tuple[Path, Path, str]]:
+    """ Perform each rename, yielding (old, new, error) """
+    for old, new in plan:
+        error = ""
+        if old != new:
+            try:
+                # Never overwrite: os.rename silently replaces files on POSIX
+                if os.path.lexists(new) and not os.path.samefile(old, new):
+                    raise FileExistsError(f"target exists: {new}")
+                os.rename(old, new)
+            except OSError as e:
+                error = str(e)
+        yield old, new, error
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="metamorph-rename", description="Apply MetaMorph rename rules without the GUI.")
+    parser.add_argument('rules', help="YAML/JSON rule set")
+    parser.add_argument('paths', nargs='*', default=['-'], help="files or directories; '-' or nothing reads paths from stdin")
+    parser.add_argument('-r', '--recursive', action='store_true', help="walk directories recursively")
+    parser.add_argument('-m', '--metadata', help="YAML/JSON metadata keyed by filename (overrides the rule set's)")
+    parser.add_argument('-s', '--start-index', type=int, default=0, help="index of the first file for numbering rules")
+    parser.add_argument('-a', '--all', action='store_true', help="also list files whose name does not change")
+    parser.add_argument('--apply', action='store_true', help="perform the renames instead of only printing the plan")
+    args = parser.parse_args(argv)
+
+    try:
+        rules, metadata = load_rule_set(args.rules)
+        if args.metadata:
+            metadata = load_document(args.metadata) or {}
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        print(f"metamorph-rename: cannot load rules: {e}", file=sys.stderr)
+        return 2
+
+    ruleset = CompiledRuleSet(rules)
+    plan = plan_renames(iter_input_paths(args.paths, args.recursive), ruleset, metadata, args.start_index)
+    if not args.all:
+        plan = ((old, new) for old, new in plan if old != new)
+    results = apply_renames(plan) if args.apply else ((old, new, "") for old, new in plan)
+
+    failures = 0
+    out = sys.stdout
+    for old, new, error in results:
+        if error:
+            failures += 1
+            print(f"{old}\t{new}\t{error}", file=sys.stderr)
+        else:
+            out.write(f"{old}\t{new}\n")
+    out.flush()
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -18,6 +18,7 @@ class ProgressDialog(ctk.CTkToplevel):
         self.message = message
         self.canceled = False
         self.paused = False
+        self.scheduler = None    # the batch's TranscodeScheduler, set once its pipeline is built
         self.btn_imgs = {
             'resume': ctk.CTkImage(light_image=Image.open(Config.BTN_IMGS['resume']),
                                    dark_image=Image.open(Config.BTN_IMGS['resume']),
@@ -56,6 +57,9 @@ class ProgressDialog(ctk.CTkToplevel):
         self.file_progress_bar.grid(row=3, column=0, columnspan=3, padx=10, pady=5, sticky='ew')
         progress_frame.pack(fill='both', pady=(10, 20), padx=30)
 
+        self.stage_text = ctk.StringVar(value="")
+        ctk.CTkLabel(self, textvariable=self.stage_text, font=("Helvetica", 10), wraplength=460).pack()
+
         btn_frame = ctk.CTkFrame(self)
         ctk.CTkButton(btn_frame, text="Cancel", image=self.btn_imgs['cancel'], compound='left', width=50,
                       command=self._on_cancel).pack(side='left', padx=2, pady=5)
@@ -66,17 +70,19 @@ class ProgressDialog(ctk.CTkToplevel):
 
     def _toggle_pause_resume(self):
         if not self.paused:
-            self.master.hb.pause()
+            self.scheduler.pause()
             self.pause_resume.configure(text="Resume", image=self.btn_imgs['resume'])
             self.paused = True
         else:
-            self.master.hb.resume()
+            self.scheduler.resume()
             self.pause_resume.configure(text="Pause", image=self.btn_imgs['pause'])
             self.paused = False
 
     def _on_cancel(self):
         if messagebox.askokcancel("Cancel", "Are you sure you want to cancel?"):
             self.canceled = True
+            if self.scheduler:
+                self.scheduler.cancel()
             self.destroy()
 
     def update_progress(self, percent, message):
@@ -1,9 +1,10 @@
 import customtkinter as ctk
+from tkinter import messagebox
 from typing import Optional
 
 from core.utils import center_dialog
 from core.config import Config
-from core.rules import RenameRule
+from core.rules import RenameRule, validate_rule
 from ui.widgets import CTkLabelInput, CTkSpinBox
 
 class RuleDialog(ctk.CTkToplevel):
@@ -82,7 +83,7 @@ class RuleDialog(ctk.CTkToplevel):
         self.remove_start.grid(row=0, column=0)
         self.remove_length = CTkLabelInput(f_remove, label="Length:", input_class=CTkSpinBox,
                                         input_args={'start': 0, 'end': 9999, 'width': 50})
-        self.remove_length.grid(row=0, column=0)
+        self.remove_length.grid(row=1, column=0)
         self.param_frames["remove"] = f_remove
         # --- Change Case ---
         f_case = ctk.CTkFrame(frm)
@@ -220,5 +221,12 @@ class RuleDialog(ctk.CTkToplevel):
         elif key == "new_name":
             params = {"template": self.tpl_entry.get()}
 
-        self.result = RenameRule(type=t, params=params)
+        rule = RenameRule(type=t, params=params)
+        # Reject broken rules here instead of failing once per file in the preview
+        try:
+            validate_rule(rule)
+        except ValueError as e:
+            messagebox.showerror("Invalid Rule", str(e), parent=self)
+            return
+        self.result = rule
         self.destroy()
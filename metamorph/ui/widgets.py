@@ -232,12 +232,13 @@ class CTkLabelFrame(ctk.CTkFrame):
                 slave.pack_configure(padx=self.internal_padx, pady=self.internal_pady)
 
 class RuleList(ctk.CTkFrame):
-    def __init__(self, master, on_edit: Callable, on_remove: Callable, *args, **kwargs):
+    def __init__(self, master, on_edit: Callable, on_remove: Callable, *args, on_toggle: Optional[Callable] = None, **kwargs):
         super().__init__(master, *args, **kwargs)
 
         # ----- Attributes -----
         self.on_edit = on_edit
         self.on_remove = on_remove
+        self.on_toggle = on_toggle
         self.rule_widgets = []
 
         self._create_widgets()
@@ -297,3 +298,5 @@ class RuleList(ctk.CTkFrame):
     def _toggle_rule(self, rule, var: ctk.BooleanVar):
         """Toggle rule on/off."""
         rule.enabled = var.get()
+        if self.on_toggle:
+            self.on_toggle()
@@ -1,3 +1,5 @@
+import os
+import queue
 import threading
 import customtkinter as ctk
 from tkinter import ttk, messagebox
@@ -6,8 +8,19 @@ from pathlib import Path
 
 from core.config import Config, Logger
 from core.utils import center_toscreen
-from core.handbrake import HandBrake
-from core.rules import apply_rule_to_path
+from core.catalog import MediaCatalog
+from core.presets import preload_preset_index
+from core.probe import ProbeCache
+from core.pipeline import describe_stages
+from core.batch_pipeline import BatchPipeline
+from core.routing import PresetRouter
+from core.encode_window import EncodeWindow
+from core.fscache import FileStatCache
+from core.collisions import detect_collisions
+from core.journal import Journal
+from core.batch_journal import BatchJournal, DONE, FAILED, CANCELLED
+from core.rename_plan import RenamePlan, RenameError
+from core.rules import CompiledRuleSet, StageCache, apply_rules_batch
 from ui.menus import MainMenu, ToolBar
 from ui.widgets import RuleList, CTkLabelFrame
 from ui.dialogs.rule import RuleDialog
@@ -64,8 +77,19 @@ class Application(ctk.CTk):
         self.rules = []
         self.tv_metadata = {}
         self.csv_metadata = {}
+        self.stage_cache = StageCache()
+        self.stat_cache = FileStatCache()
+        self.scheduler = None
+        self.catalog = MediaCatalog(os.path.join(Config.get('Cache Directory'), "catalog.jsonl"))
+        self.probe_cache = ProbeCache(os.path.join(Config.get('Cache Directory'), "probe.jsonl"))
+
+        self.events = queue.Queue()
+        # Parse the presets JSON (or load its cached index) before Preferences or a batch needs it
+        preload_preset_index(Config.get('HB Presets JSON'), Config.get('Cache Directory'))
 
         self.build_ui()
+        self.after(50, self._drain_events)
+        self.after(500, self._check_interrupted_renames)
 
     def build_ui(self):
         # ----- Main Menu -----
@@ -81,7 +105,7 @@ class Application(ctk.CTk):
         # ----- Main Content Area -----
         content_frame = ctk.CTkFrame(self)
         rule_frame = CTkLabelFrame(content_frame, label="  Renaming Rules:", font=ctk.CTkFont(size=10, weight='bold'), label_bg="#95a5a6")
-        self.rule_list = RuleList(rule_frame, self.edit_rule, self.remove_rule)
+        self.rule_list = RuleList(rule_frame, self.edit_rule, self.remove_rule, on_toggle=self.refresh_list)
         self.rule_list.pack(fill='both', expand=True)
         rbtn_frame = ctk.CTkFrame(rule_frame)
         ctk.CTkButton(rbtn_frame, text="Add", width=50, command=self.add_rule).pack(side='left', padx=2, pady=5)
@@ -152,19 +176,42 @@ class Application(ctk.CTk):
     def refresh_list(self):
         for row in self.file_list.get_children():
             self.file_list.delete(row)
-        for i, p in enumerate(self.files):
-            try:
-                new_path = self._apply_rules_in_sequence(p, index=i)
-                status = "Pending" if not new_path.exists() or new_path == p else "Collision"
-                self.file_list.insert('', 'end', values=(p.name, new_path.name, status))
-            except Exception as e:
-                self.file_list.insert('', 'end', values=(p.name, new_path.name, f"Error: {e}"))
-                self.logger.error(f"Encountered error: {e}")
+        # Every directory is stat'ed once and only rescanned when it changed
+        self.stat_cache.revalidate()
+        try:
+            targets = apply_rules_batch(self.files, self.rules, self._metadata_map(),
+                                        parallel_threshold=Config.get('Parallel Preview Threshold') or None,
+                                        stage_cache=self.stage_cache, stat_cache=self.stat_cache)
+        except Exception as e:
+            # Fall back to per-file preview so the failing rows can be reported individually
+            self.logger.error(f"Batch preview failed, retrying per file: {e}")
+            targets = None
+        errors = {}
+        if targets is None:
+            ruleset = CompiledRuleSet(self.rules, self.stat_cache)
+            targets = []
+            for i, p in enumerate(self.files):
+                try:
+                    targets.append(self._apply_rules_in_sequence(p, index=i, ruleset=ruleset))
+                except Exception as e:
+                    targets.append(p)
+                    errors[i] = e
+                    self.logger.error(f"Encountered error: {e}")
+
+        # Existing files and duplicate targets within the batch, in one pass
+        statuses = detect_collisions(self.files, targets, self.stat_cache,
+                                     case_insensitive=Config.get('Case Insensitive Targets'))
+        for i, (p, new_path, status) in enumerate(zip(self.files, targets, statuses)):
+            if i in errors:
+                status = f"Error: {errors[i]}"
+            self.file_list.insert('', 'end', values=(p.name, new_path.name, status))
         
         self.status_bar.configure(text=f"Preview refreshed. {len(self.files)} items")
 
     def clear_list(self):
         self.files.clear()
+        self.stage_cache.clear()
+        self.stat_cache.clear()
         self.refresh_list()
         self.logger.info("file table cleared")
 
@@ -266,25 +313,25 @@ class Application(ctk.CTk):
         self.file_list.item(item_id, tags=("overridden",))
         self.logger.info(f"Deferred rename queued: {orig_name} → {new_name}")
 
-    def _apply_rules_in_sequence(self, path: Path, index: int = 0) -> Path:
-        current = path
-        seqnum = None
+    def _apply_rules_in_sequence(self, path: Path, index: int = 0, ruleset: CompiledRuleSet | None = None) -> Path:
+        # Callers applying rules to many files should compile once and pass the ruleset in
+        if ruleset is None:
+            ruleset = CompiledRuleSet(self.rules)
+        return ruleset.run(path, index, self._metadata_for(path.name))
+
+    def _metadata_for(self, filename: str) -> dict:
         # Merge metadata sources: first TV metadata, then CSV metadata (CSV overrides TV if same key)
         metadata = {}
         if hasattr(self, 'tv_metadata') and isinstance(self.tv_metadata, dict):
-            metadata.update(self.tv_metadata.get(path.name, {}))
+            metadata.update(self.tv_metadata.get(filename, {}))
         if hasattr(self, 'csv_metadata') and isinstance(self.csv_metadata, dict):
-            metadata.update(self.csv_metadata.get(path.name, {}))
-
-        for r in self.rules:
-            if not r.enabled:
-                continue
-            if r.type.lower() == "numbering":
-                start = int(r.params.get("start", 1))
-                inc = int(r.params.get("increment", 1))
-                seqnum = start + index * inc
-            current = apply_rule_to_path(r, current, seqnum, metadata=metadata)
-        return current
+            metadata.update(self.csv_metadata.get(filename, {}))
+        return metadata
+
+    def _metadata_map(self) -> dict:
+        """Merged metadata for every imported filename, as expected by apply_rules_batch."""
+        names = set(self.tv_metadata) | set(self.csv_metadata)
+        return {name: self._metadata_for(name) for name in names}
 
     def _sync_file_from_table(self):
         """Rebuild self.files based on Treeview order."""
@@ -322,8 +369,9 @@ class Application(ctk.CTk):
 
     def edit_rule(self, idx):
         dlg = RuleDialog(self, existing=self.rules[idx]); self.wait_window(dlg)
-        if dlg.result_rule:
-            self.rules[idx] = dlg.result_rule
+        if dlg.result:
+            dlg.result.enabled = self.rules[idx].enabled
+            self.rules[idx] = dlg.result
             self.rule_list.refresh(self.rules)
             self.refresh_list()
         
@@ -380,122 +428,243 @@ class Application(ctk.CTk):
             self.logger.error("No files to process")
             return
         
+        router = self._preset_router()
+        window = self._encode_window()
+        if router is None or window is None:
+            return
+
+        # ----- Rename plan: computed for the whole batch before anything is touched -----
+        ruleset = CompiledRuleSet(self.rules)
+        pairs = [(file, file.parent / self._batch_target_name(file, idx, ruleset)) for idx, file in enumerate(self.files)]
+        try:
+            plan = RenamePlan(pairs, case_insensitive=Config.get('Case Insensitive Targets'))
+            plan.validate()
+        except (ValueError, OSError) as e:
+            messagebox.showerror("Error", f"Cannot rename files: {e}")
+            self.logger.error(f"Cannot rename files: {e}")
+            return
+        journal = self._rename_journal()
+        journal.remove()
+        # Every file's progress is journaled so a crashed batch can be resumed on relaunch
+        batch = self._batch_journal()
+        batch.begin(pairs, output_dir=Config.get("Output Directory"), del_original=Config.get("Delete Original"))
+
         dlg = ProgressDialog(self, title="Batch Progress", message="Transcoding files...")
-        self.hb = HandBrake()
-        total_files = len(self.files)
-
-        def process_next_file(idx=0):
-            # run entirely in a background thread
-            if dlg.canceled or idx >= total_files:
-                # ensure hb subprocess is terminated if running
-                if self.hb.process and self.hb.process.poll() is None:
-                    try:
-                        self.hb.process.terminate()
-                    except Exception:
-                        pass
-                self.overrides.clear()
-                # schedule dialog destroy and status update on main thread
-                def finish_gui():
-                    if dlg.winfo_exists():
-                        dlg.destroy()
-                    self.status_bar.configure(text="Batch canceled" if dlg.canceled else "Batch finished")
-                self.after(0, finish_gui)
+        # Built here so Cancel and Pause act on this batch's scheduler while the renames still run
+        pipeline = self._start_pipeline(batch, len(pairs), dlg, router, window)
+
+        def run_renames():
+            try:
+                pipeline.rename(plan, pairs, journal, max_workers=int(Config.get('Rename Workers') or 4))
+            except (RenameError, OSError) as e:
+                self.logger.error(f"Renaming failed: {e}")
+                self._post(self._on_rename_failed, e, journal, dlg)
                 return
+            journal.remove()
+            self.files = [dst for _, dst in pairs]
 
-            file = self.files[idx]
-            # --- Apply deferred override if one exists ---
-            orig_name = file.name
-            if hasattr(self, "overrides") and orig_name in self.overrides:
-                override_name = self.overrides[orig_name]
-                # Preserve extension if user forgot it
-                if "." not in override_name:
-                    override_name += file.suffix
-                new_path = file.parent / override_name
-                self.logger.info(f"Applying deferred override for {orig_name} → {override_name}")
-            else:
-                # Fall back to standard rule-based rename
-                new_path = self._apply_rules_in_sequence(file, index=idx)
+        self.logger.info("Processing batch")
+        # rename -> probe -> transcode on up to 'Max Workers' HandBrakeCLI processes -> cleanup; the GUI loop keeps running
+        threading.Thread(target=run_renames, daemon=True).start()
+        dlg.wait_window()
 
-            # Rename/move original file to new name
+    def _start_pipeline(self, batch: BatchJournal, total: int, dlg, router: PresetRouter, window: EncodeWindow) -> BatchPipeline:
+        """
+        Start the stages of a batch (called on the Tk thread, before any file is fed) and hand
+        its scheduler to dlg. Feed the returned pipeline from a worker thread: put() may block.
+        """
+        # Jobs are keyed by file index; rows are looked up by position so progress lands on the right file
+        rows = self.file_list.get_children()
+        row_ids = list(rows) if len(rows) == len(self.files) else [None] * len(self.files)
+        reported = []
+
+        def set_status(job, value):
+            row = row_ids[job.job_id]
+            if row and self.file_list.exists(row):
+                self.file_list.set(row, column="Status", value=value)
+
+        def show_start(job):
+            set_status(job, "⏳")
+
+        def show_progress(job, percent):
+            if not dlg.winfo_exists():
+                return
+            details = job.progress.describe() if job.progress else ""
+            dlg.update_progress(percent, message=f"Processing: {Path(job.input_file).name}" + (f" ({details})" if details else ""))
+            update_total()
+
+        def show_done(job):
+            name = Path(job.input_file).name
+            self.status_bar.configure(text=f"{job.state.capitalize()}: {name}" + (f" ({job.error})" if job.error else ""))
+            set_status(job, "❌" if job.state in (FAILED, CANCELLED) else "✅")
+            update_total()
+            report(job)
+
+        def report(job):
+            name = Path(job.input_file).name
+            if job.error and not reported:
+                # One dialog per batch; later failures only show in the table and status bar
+                reported.append(job.error)
+                messagebox.showerror("Error", f"Transcoding {name} failed: {job.error}")
+
+        def update_total():
+            if not dlg.winfo_exists():
+                return
+            jobs = list(pipeline.scheduler.jobs.values())
+            pcnt = sum(100.0 if job.state in (DONE, "skipped") else job.percent for job in jobs) / max(1, total)
+            dlg.total_progress.set(pcnt / 100)
+            dlg.total_text.set(f"{pcnt:.2f}%")
+
+        def show_stages():
+            if dlg.winfo_exists():
+                dlg.stage_text.set(describe_stages(pipeline.stats()))
+                dlg.after(1000, show_stages)
+
+        def show_finished(cancelled):
+            self.overrides.clear()
+            if dlg.winfo_exists():
+                dlg.destroy()
+            self.status_bar.configure(text="Batch canceled" if cancelled or dlg.canceled else "Batch finished")
+
+        # Pipeline callbacks run on worker threads: they only post to the Tk event queue
+        pipeline = BatchPipeline(batch, total, router, window,
+                                 catalog=self.catalog if Config.get('Skip Transcoded') else None,
+                                 probe_cache=self.probe_cache,
+                                 on_start=lambda job: self._post(show_start, job),
+                                 on_progress=lambda job, percent: self._post(show_progress, job, percent),
+                                 on_done=lambda job: self._post(show_done, job),
+                                 on_rejected=lambda job, reason: self._post(show_done, job),
+                                 on_finished=lambda cancelled: self._post(show_finished, cancelled))
+        self.scheduler = dlg.scheduler = pipeline.scheduler
+        pipeline.start()
+        show_stages()
+        return pipeline
+
+    def _post(self, func, *args):
+        """Run func(*args) on the Tk thread; safe to call from any thread."""
+        self.events.put((func, args))
+
+    def _drain_events(self):
+        """Run the callables posted by worker threads, a bounded number per tick."""
+        for _ in range(500):
             try:
-                renamed_file = file.parent / new_path.name
-                if file != renamed_file:
-                    file.rename(renamed_file)
-                # update stored path to the renamed Path
-                self.files[idx] = renamed_file
-                input_path_for_hb = str(self.files[idx])
+                func, args = self.events.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                func(*args)
             except Exception as e:
-                # schedule error message and continue with next file
-                self.after(0, lambda: messagebox.showerror("Error", f"Failed to rename {file}: {e}"))
-                self.logger.error(f"Failed to rename {file}: {e}")
-                # start next file in a new background thread
-                threading.Thread(target=process_next_file, args=(idx + 1,), daemon=True).start()
+                self.logger.error(f"UI event failed: {e}")
+        self.after(50, self._drain_events)
+
+    def _preset_router(self) -> PresetRouter | None:
+        """Routing table from the 'Preset Routes' setting; None (after telling the user) if it is invalid."""
+        try:
+            return PresetRouter.from_config(Config.get('Preset Routes'), Config.get('HB Preset'))
+        except (ValueError, TypeError) as e:
+            messagebox.showerror("Error", f"Invalid 'Preset Routes' setting: {e}")
+            self.logger.error(f"Invalid 'Preset Routes' setting: {e}")
+            return None
+
+    def _encode_window(self) -> EncodeWindow | None:
+        """Hours from the 'Encode Window' setting; None (after telling the user) if it is invalid."""
+        try:
+            return EncodeWindow.parse(Config.get('Encode Window'))
+        except ValueError as e:
+            messagebox.showerror("Error", f"Invalid 'Encode Window' setting: {e}")
+            self.logger.error(f"Invalid 'Encode Window' setting: {e}")
+            return None
+
+    def _batch_target_name(self, file: Path, idx: int, ruleset: CompiledRuleSet) -> str:
+        # --- Apply deferred override if one exists ---
+        orig_name = file.name
+        if hasattr(self, "overrides") and orig_name in self.overrides:
+            override_name = self.overrides[orig_name]
+            # Preserve extension if user forgot it
+            if "." not in override_name:
+                override_name += file.suffix
+            self.logger.info(f"Applying deferred override for {orig_name} → {override_name}")
+            return override_name
+        # Fall back to standard rule-based rename
+        return self._apply_rules_in_sequence(file, index=idx, ruleset=ruleset).name
+
+    def _rename_journal(self) -> Journal:
+        return Journal(os.path.join(Config.get('Journal Directory'), "renames.jsonl"))
+
+    def _batch_journal(self) -> BatchJournal:
+        return BatchJournal(os.path.join(Config.get('Journal Directory'), "batch.jsonl"))
+
+    def _on_rename_failed(self, error, journal: Journal, dlg):
+        if dlg.winfo_exists():
+            dlg.destroy()
+        if messagebox.askyesno("Rename Failed", f"{error}\n\nRoll back the files renamed so far?"):
+            try:
+                RenamePlan.rollback(journal, max_workers=int(Config.get('Rename Workers') or 4))
+            except (RenameError, OSError) as e:
+                messagebox.showerror("Error", f"Rollback failed: {e}")
+                self.logger.error(f"Rollback failed: {e}")
                 return
+        journal.remove()
+        self._batch_journal().remove()
+        self.status_bar.configure(text="Batch aborted: renaming failed")
+        self.refresh_list()
 
-            def on_progress(percent, input_file):
-                # schedule GUI update
-                dlg.after(0, lambda: dlg.update_progress(percent, message=f"Processing: {input_file}"))
-
-                # update the status to show spinner (⏳) for current file
-                for item in self.file_list.get_children():
-                    values = self.file_list.item(item, "values")
-                    if values and values[0] == Path(input_file).name:
-                        self.file_list.set(item, column="Status", value="⏳")
-                        break
-
-            def on_done(success, input_file, output_file, cancelled=False):
-                # schedule GUI update on main thread, then start next file in background
-                def gui_update():
-                    name = Path(input_file).name if input_file else "(unknown)"
-                    if success:
-                        self.status_bar.configure(text=f"Done: {name}")
-                    elif cancelled:
-                        self.status_bar.configure(text=f"Cancelled: {name}")
-                    else:
-                        self.status_bar.configure(text=f"Failed: {name}")
-                    
-                    # update the status in the table
-                    for item in self.file_list.get_children():
-                        values = self.file_list.item(item, "values")
-                        if values and values[0] == Path(input_file).name:
-                            self.file_list.set(item, column="Status", value="✅")
-                            break
-
-                    # update total progress display
-                    if dlg.winfo_exists():
-                        pcnt = float(((idx + 1) / total_files) * 100)
-                        print(f"DEBUG: total_percent: {pcnt:2f}%")
-                        dlg.total_progress.set(pcnt / 100)
-                        dlg.total_text.set(f"{pcnt:.2f}%")
-
-                    # start next file in a new worker thread (NOT on GUI thread)
-                    if not dlg.canceled:
-                        threading.Thread(target=process_next_file, args=(idx + 1,), daemon=True).start()
-                    else:
-                        # if canceled, ensure hb subprocess terminated and close dialog
-                        if self.hb.process and self.hb.process.poll() is None:
-                            try:
-                                self.hb.process.terminate()
-                            except Exception:
-                                pass
-                        if dlg.winfo_exists():
-                            dlg.destroy()
-                self.after(0, gui_update)
-
-            # Run HandBrake in this worker thread (blocks this thread only)
-            self.hb.transcode(
-                input_path_for_hb,
-                Config.get("Output Directory"),
-                progress_callback=on_progress,
-                done_callback=on_done,
-                del_original=Config.get("Delete Original"),
-                cancel_flag=lambda: dlg.canceled
-            )
-        self.logger.info("Processing next file")
-        # start the first file in a background thread and let the GUI loop run
-        threading.Thread(target=process_next_file, args=(0,), daemon=True).start()
+    def _check_interrupted_renames(self):
+        """Offer to finish or undo a rename batch that was interrupted by a crash."""
+        journal = self._rename_journal()
+        if not RenamePlan.is_interrupted(journal):
+            journal.remove()
+            self._check_interrupted_batch()
+            return
+        answer = messagebox.askyesnocancel("Interrupted Batch",
+                                           "A previous batch was interrupted while renaming files.\n\n"
+                                           "Yes: finish the renames\nNo: roll them back\nCancel: decide later")
+        if answer is None:
+            return
+        workers = int(Config.get('Rename Workers') or 4)
+        try:
+            if answer:
+                RenamePlan.resume(journal, max_workers=workers)
+            else:
+                RenamePlan.rollback(journal, max_workers=workers)
+                self._batch_journal().remove()
+            journal.remove()
+        except (RenameError, OSError) as e:
+            messagebox.showerror("Error", f"Recovering the interrupted batch failed: {e}")
+            self.logger.error(f"Recovering the interrupted batch failed: {e}")
+            return
+        self._check_interrupted_batch()
+
+    def _check_interrupted_batch(self):
+        """Offer to resume the transcodes of a batch that was interrupted by a crash."""
+        batch = BatchJournal.load(self._batch_journal().journal.path)
+        pending = batch.pending()
+        if not batch.is_interrupted() or not pending:
+            batch.remove()
+            return
+        if not messagebox.askyesno("Resume Batch",
+                                   f"A previous batch stopped with {len(pending)} of {len(batch.files)} files "
+                                   "left to transcode.\n\nResume it now?"):
+            batch.remove()
+            return
+        router = self._preset_router()
+        window = self._encode_window()
+        if router is None or window is None:
+            return
+        # Renames are finished at this point; fall back to the source for files never renamed
+        self.files = [Path(dst) if os.path.lexists(dst) else Path(src) for src, dst in batch.files]
+        self.refresh_list()
+        dlg = ProgressDialog(self, title="Batch Progress", message="Resuming batch...")
+        pipeline = self._start_pipeline(batch, len(pending), dlg, router, window)
+
+        def run_pending():
+            for idx in pending:
+                pipeline.put(idx, str(self.files[idx]))
+            pipeline.close()
+
+        threading.Thread(target=run_pending, daemon=True).start()
         dlg.wait_window()
-        
+
     # ---------------
     # Settings Management
     # ---------------
@@ -39,6 +39,7 @@ class PreferencesWindow(ctk.CTkToplevel):
         self._add_path_input(paths_tab, "HB Presets JSON")
         self._add_dir_input(paths_tab, "Output Directory")
         self._add_dir_input(paths_tab, "Log Directory")
+        self._add_dir_input(paths_tab, "Scratch Directory")
 
         # --- PRESETS TAB ---
         self._add_hb_presets_section(presets_tab)
@@ -48,6 +49,9 @@ class PreferencesWindow(ctk.CTkToplevel):
 
         # --- OTHER TAB ---
         self._add_checkbox(misc_tab, "Delete Original")
+        self._add_checkbox(misc_tab, "Longest Jobs First")
+        self._add_checkbox(misc_tab, "Adaptive Workers")
+        self._add_checkbox(misc_tab, "Pin Worker CPUs")
 
         # --- BUTTONS ---
         button_frame = ctk.CTkFrame(self)